@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+import httpx
+
+# --- Конфигурация ---
+API_BASE_URL = os.getenv("API_BASE_URL", "https://vse-v-poryadke-production.up.railway.app")
+# http — запросы к API по сети, local — прямые вызовы, когда бот работает в одном процессе с API
+API_MODE = os.getenv("API_MODE", "local" if os.getenv("COMBINED_MODE", "0") == "1" else "http")
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "10"))
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "100"))
+API_RETRY_BACKOFF_SECONDS = 0.2
+
+class HttpApiClient:
+    """Общий асинхронный клиент API: keep-alive соединения, таймауты и повторы"""
+
+    def __init__(self, base_url=API_BASE_URL, timeout=API_TIMEOUT_SECONDS, retries=API_RETRIES):
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_CONNECTIONS
+            )
+        )
+
+    async def post(self, path, payload, idempotent):
+        """POST с повторами.
+
+        Ошибки соединения повторяем всегда (запрос не ушёл), таймауты чтения
+        и 5xx — только для идемпотентных запросов.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.post(path, json=payload)
+                response.raise_for_status()
+                return response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt == self.retries:
+                    raise
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if not idempotent or attempt == self.retries:
+                    raise
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code < 500 or not idempotent or attempt == self.retries:
+                    raise
+            await asyncio.sleep(API_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    async def register(self, telegram_id: str, name: str, contact_telegram_id: str):
+        payload = {
+            "telegram_id": telegram_id,
+            "name": name,
+            "contact_telegram_id": contact_telegram_id
+        }
+        return await self.post("/register", payload, idempotent=False)
+
+    async def checkin(self, telegram_id: str):
+        return await self.post("/checkin", {"telegram_id": telegram_id}, idempotent=True)
+
+    async def close(self):
+        await self.client.aclose()
+
+class LocalApiClient:
+    """Вызовы API внутри процесса: маршруты main.py вызываются как обычные функции"""
+
+    async def register(self, telegram_id: str, name: str, contact_telegram_id: str):
+        # Импорт здесь: main сам может импортировать бота
+        import main
+        return await main.register_endpoint(main.RegisterRequest(
+            telegram_id=telegram_id,
+            name=name,
+            contact_telegram_id=contact_telegram_id
+        ))
+
+    async def checkin(self, telegram_id: str):
+        import main
+        return await main.checkin_endpoint(main.CheckinRequest(telegram_id=telegram_id))
+
+    async def close(self):
+        pass
+
+def create_api_client(base_url=API_BASE_URL, mode=API_MODE):
+    if mode == "local":
+        # Без запущенного API (отдельный python bot_server.py) каждая команда упала бы на закрытой базе
+        api = sys.modules.get("main")
+        if api is None or api.storage.readers is None:
+            raise ValueError("API_MODE=local работает только в процессе API (COMBINED_MODE=1 или WEBHOOK_MODE=1)")
+        return LocalApiClient()
+    return HttpApiClient(base_url)
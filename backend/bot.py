@@ -1,11 +1,15 @@
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram import Update
-import requests
 import asyncio
 from config import TELEGRAM_BOT_TOKEN
+from api_client import HttpApiClient
 
 # --- Глобальные переменные ---
 BASE_URL = "http://127.0.0.1:8000"
+api_client = HttpApiClient(BASE_URL)
+
+async def close_api_client(application: Application):
+    await api_client.close()
 
 # --- Команды бота ---
 
@@ -40,15 +44,8 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
     contact_id = context.args[1]
 
     # Отправляем запрос на регистрацию
-    payload = {
-        "telegram_id": user_id,
-        "name": name,
-        "contact_telegram_id": contact_id
-    }
-    
     try:
-        response = requests.post(f"{BASE_URL}/register", json=payload)
-        data = response.json()
+        data = await api_client.register(user_id, name, contact_id)
         
         if data["status"] == "ok":
             await context.bot.send_message(
@@ -71,11 +68,8 @@ async def checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     
     # Отправляем запрос на отметку
-    payload = {"telegram_id": user_id}
-    
     try:
-        response = requests.post(f"{BASE_URL}/checkin", json=payload)
-        data = response.json()
+        data = await api_client.checkin(user_id)
         
         if data["status"] == "ok":
             await context.bot.send_message(
@@ -95,7 +89,7 @@ async def checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- Основная функция запуска бота ---
 def main():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_shutdown(close_api_client).build()
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
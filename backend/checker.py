@@ -1,70 +1,203 @@
 import asyncio
-import requests
-from datetime import datetime, timedelta
-from telegram.ext import Application
-from config import TELEGRAM_BOT_TOKEN
+import multiprocessing
+import os
 import time
+from telegram import Bot
+from config import TELEGRAM_BOT_TOKEN
+from leases import PartitionLeases
+from metrics import (
+    CHECKER_ALARMS, CHECKER_CHANGES, CHECKER_CYCLE_SECONDS, CHECKER_DUE_USERS, CHECKER_SCHEDULED,
+    CHECKER_USERS_SCANNED, CHECKER_WINDOW_SECONDS, METRICS_PORT, start_metrics_server
+)
+from notifier import NotificationDispatcher, PRIORITY_ALARM, TELEGRAM_API_BASE_URL
+from scheduler import DeadlineScheduler
+from storage import DUE_PAGE_SIZE, HASH_BUCKETS, Storage
 
 # --- Глобальные переменные ---
-BASE_URL = "http://127.0.0.1:8000"
-CHECK_INTERVAL_SECONDS = 30  # Проверять каждые 30 секунд (для теста). В продакшене — 3600 (1 час)
+CHANGE_FEED_INTERVAL_SECONDS = 5  # Как часто читать ленту новых отметок и регистраций
+CLAIM_RETRY_SECONDS = 5  # Пауза перед повтором тревог, если запись в журнал не удалась
+# Сколько проверяющих процессов запустить из одной команды; они делят разделы через аренду
+CHECKER_WORKERS = int(os.getenv("CHECKER_WORKERS", "1"))
 
 class StatusChecker:
-    def __init__(self):
-        self.bot_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    def __init__(self, storage=None, bot=None):
+        # В одном процессе с API (COMBINED_MODE) база и клиент Telegram общие, их открывает main.py
+        self.owns_storage = storage is None
+        self.storage = storage or Storage()
+        self.bot = bot or Bot(TELEGRAM_BOT_TOKEN, base_url=TELEGRAM_API_BASE_URL)
+        self.dispatcher = NotificationDispatcher(self.storage, self.bot, owns_bot=bot is None)
+        self.leases = PartitionLeases(self.storage)
+        self.lease_owner = None  # Задан, пока процесс работает по аренде разделов
+        self.buckets = None  # Корзины арендованных разделов; None — все
+        self.scheduler = DeadlineScheduler(self.load_deadlines)
+        self.scheduler_task = None
+        self.change_seq = 0  # Водяной знак ленты изменений
 
-    async def send_telegram_message(self, chat_id, message):
-        """Отправка сообщения в Telegram"""
-        try:
-            await self.bot_app.updater.bot.send_message(chat_id=chat_id, text=message)
-            print(f"✅ Сообщение отправлено {chat_id}: {message}")
-        except Exception as e:
-            print(f"❌ Ошибка отправки в Telegram {chat_id}: {e}")
+    async def load_deadlines(self, after, until):
+        """Окно дедлайнов для планировщика: только (after, until] по индексу deadline"""
+        started = time.perf_counter()
+        async for page in self.storage.iter_users_by_deadline(until, after=after, buckets=self.buckets):
+            CHECKER_USERS_SCANNED.inc(len(page))
+            for user in page:
+                yield user["telegram_id"], user["deadline"]
+        CHECKER_WINDOW_SECONDS.observe(time.perf_counter() - started)
 
-    async def check_users(self):
-        """Проверка статусов всех пользователей"""
+    def build_alarm(self, user):
+        """Уведомление контакту для журнала тревог"""
+        user_id = user["telegram_id"]
+        contact_id = user["contact_telegram_id"]
+
+        if not contact_id or contact_id == "None":
+            print(f"ℹ️ Контакт пользователя {user_id} не указан или пустой")
+            return None
+
+        alarm_message = f"⚠️ ТРЕВОГА: Пользователь {user_id} не отмечался более 24 часов!"
+        # Ключ по дедлайну: одна тревога на один пропуск отметки
+        return contact_id, alarm_message, PRIORITY_ALARM, f"alarm:{user_id}:{user['deadline']}"
+
+    async def check_users(self, due):
+        """Тревоги пользователям, чей дедлайн наступил"""
+        started = time.perf_counter()
+        CHECKER_DUE_USERS.inc(len(due))
         try:
-            # Простой тест: проверим твой ID
-            user_id = "347445457"
-            
-            print(f"Проверка пользователя {user_id}...")
-            
-            response = requests.get(f"{BASE_URL}/status/{user_id}")
-            if response.status_code != 200:
-                print(f"❌ Ошибка HTTP {response.status_code} при запросе /status/{user_id}")
-                return
-                
-            data = response.json()
-            print(f"📊 Получен ответ: {data}")
-            
-            if data.get("status") == "ALARM":
-                contact_id = data.get("contact_telegram_id")
-                
-                if contact_id and contact_id != "None":
-                    alarm_message = f"⚠️ ТРЕВОГА: Пользователь {user_id} не отмечался более 24 часов!"
-                    await self.send_telegram_message(contact_id, alarm_message)
-                    print(f"✅ Отправлено уведомление контакту {contact_id}")
-                else:
-                    print("ℹ️ Контакт не указан или пустой")
-            else:
-                print("🟢 Статус OK, уведомление не требуется")
-                
+            # Журнал отсеивает тех, кто успел отметиться или уже получил тревогу
+            # Аренда проверяется в той же транзакции: раздел, ушедший другому процессу, пропускается
+            alarms, notifications = await self.storage.claim_alarms(
+                [telegram_id for telegram_id, _ in due], time.time(), self.build_alarm, self.lease_owner
+            )
+            for item in notifications:
+                self.dispatcher.push(item)
+            CHECKER_ALARMS.inc(alarms)
+
+            if alarms:
+                print(f"📊 Новых тревог: {alarms}")
+
         except Exception as e:
             print(f"❌ Ошибка при проверке статусов: {e}")
+            # Из кучи они уже извлечены, а окна и лента их больше не вернут: ставим обратно.
+            # Кто успел отметиться, получил новый дедлайн из ленты — его не трогаем
+            await asyncio.sleep(CLAIM_RETRY_SECONDS)
+            for telegram_id, deadline in due:
+                if telegram_id not in self.scheduler.deadlines:
+                    self.scheduler.schedule(telegram_id, deadline)
+        finally:
+            CHECKER_CYCLE_SECONDS.observe(time.perf_counter() - started)
+
+    async def apply_changes(self):
+        """Разбор ленты изменений после водяного знака: переносим только изменившиеся дедлайны"""
+        while True:
+            changes = await self.storage.changes_since(self.change_seq)
+            CHECKER_CHANGES.inc(len(changes))
+            for telegram_id, deadline, alarm_sent_at, change_seq, bucket in changes:
+                self.change_seq = change_seq
+                if self.buckets is not None and bucket not in self.buckets:
+                    continue
+                if alarm_sent_at is None:
+                    self.scheduler.schedule(telegram_id, deadline)
+                else:
+                    self.scheduler.cancel(telegram_id)
+
+            if len(changes) < DUE_PAGE_SIZE:
+                return
 
-    async def run_checker(self):
-        """Основной цикл проверки"""
-        print(f"🚀 Запуск проверки статусов. Интервал: {CHECK_INTERVAL_SECONDS} секунд")
-        
+    async def follow_changes(self):
         while True:
             try:
-                await self.check_users()
+                await self.apply_changes()
+            except Exception as e:
+                print(f"❌ Ошибка чтения ленты изменений: {e}")
+            await asyncio.sleep(CHANGE_FEED_INTERVAL_SECONDS)
+
+    async def run_scheduler(self):
+        while True:
+            try:
+                await self.scheduler.run(self.check_users)
             except Exception as e:
                 print(f"❌ Ошибка в цикле проверки: {e}")
-            
-            await asyncio.sleep(CHECK_INTERVAL_SECONDS)
+                await asyncio.sleep(1)
+
+    async def stop_work(self):
+        """Остановить планировщик и отправку: неотправленное остаётся в outbox"""
+        if self.scheduler_task is not None:
+            self.scheduler_task.cancel()
+            await asyncio.gather(self.scheduler_task, return_exceptions=True)
+            self.scheduler_task = None
+        await self.dispatcher.stop()
+
+    async def start_work(self):
+        """Перезапуск под текущий набор арендованных разделов"""
+        await self.stop_work()
+        partitions = [partition for partition, _, _ in self.leases.owned]
+        if not partitions:
+            self.buckets = set()
+            print("💤 Нет арендованных разделов, ждём перераспределения")
+            return
+
+        buckets = self.leases.buckets()
+        # Все корзины: обычный индекс по дедлайну быстрее фильтра по корзинам
+        self.buckets = buckets if len(buckets) < HASH_BUCKETS else None
+        # Первое окно планировщика читает всех сразу, лента нужна только для последующих изменений
+        self.change_seq = await self.storage.last_change_seq()
+        self.scheduler = DeadlineScheduler(self.load_deadlines)
+        await self.dispatcher.start(self.buckets)
+        self.scheduler_task = asyncio.create_task(self.run_scheduler())
+        print(f"🧩 Разделы {partitions} из {self.leases.partitions}")
+
+    async def run_partitions(self):
+        """Продление аренды; при смене набора разделов работа перезапускается"""
+        while True:
+            try:
+                if await self.leases.tick(self.stop_work):
+                    await self.start_work()
+                # Лимит Telegram общий на бота: каждому процессу своя доля
+                self.dispatcher.set_workers(self.leases.live_workers)
+            except Exception as e:
+                print(f"❌ Ошибка аренды разделов: {e}")
+            await asyncio.sleep(self.leases.heartbeat_interval)
+
+    async def run_checker(self, metrics_port=METRICS_PORT):
+        """Основной цикл: спим до ближайшего дедлайна вместо опроса по интервалу"""
+        print(
+            f"🚀 Запуск проверки статусов {self.leases.worker_id}. "
+            f"Окно планировщика: {self.scheduler.horizon} секунд"
+        )
+
+        if self.owns_storage:
+            await self.storage.open()
+        await self.leases.start()
+        self.lease_owner = self.dispatcher.lease_owner = self.leases.worker_id
+        # До первой аренды работы нет; лента нужна только для изменений после старта
+        self.buckets = set()
+        self.change_seq = await self.storage.last_change_seq()
+        CHECKER_SCHEDULED.set_function(lambda: len(self.scheduler))
+        metrics_server = await start_metrics_server(metrics_port)
+
+        try:
+            await asyncio.gather(self.run_partitions(), self.follow_changes())
+        finally:
+            if metrics_server is not None:
+                metrics_server.close()
+            await self.stop_work()
+            await self.leases.stop()
+            if self.owns_storage:
+                await self.storage.close()
+
+def run_worker(index=0):
+    # У каждого процесса свой порт метрик
+    metrics_port = METRICS_PORT + index if METRICS_PORT else 0
+    try:
+        asyncio.run(StatusChecker().run_checker(metrics_port))
+    except KeyboardInterrupt:
+        pass
 
 # --- Запуск ---
 if __name__ == "__main__":
-    checker = StatusChecker()
-    asyncio.run(checker.run_checker())
\ No newline at end of file
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(index,), daemon=True)
+        for index in range(1, CHECKER_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    run_worker()
+    for worker in workers:
+        worker.join()
@@ -1,10 +1,21 @@
+import os
 import requests
 from config import TELEGRAM_BOT_TOKEN
 
 WEBHOOK_URL = "https://vse-v-poryadke-production.up.railway.app/webhook"
+# Тот же секрет, что у API (main.py): Telegram пришлёт его в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+
+if not WEBHOOK_SECRET:
+    raise ValueError("TELEGRAM_WEBHOOK_SECRET не найден в переменных окружения")
 
 url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/setWebhook"
-payload = {"url": WEBHOOK_URL}
+payload = {
+    "url": WEBHOOK_URL,
+    "secret_token": WEBHOOK_SECRET,
+    "max_connections": 100,
+    "allowed_updates": ["message"]
+}
 
 response = requests.post(url, json=payload)
 print(response.json())
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""Нагрузка на bot_server.py через поддельный Bot API.
+
+    uvicorn bench.fake_telegram:app --port 8765
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8765/bot python bot_server.py
+    python -m bench.bot_load --chats 200 --rounds 5 --out bot.json
+
+Каждый раунд отправляет команду от chats пользователей и ждёт ответы бота.
+Задержка считается поддельным сервером: от команды до ответа в тот же чат.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from bench.report import write_report
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.fake_url, timeout=30) as client:
+        await client.post("/reset")
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            await client.post("/inject", json={
+                "text": args.text, "chats": args.chats, "first_chat": args.first_chat
+            })
+            await asyncio.sleep(args.interval)
+
+        deadline = time.monotonic() + args.timeout
+        while True:
+            stats = (await client.get("/stats")).json()
+            if not stats["awaiting_reply"] or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.1)
+        duration = time.perf_counter() - started
+
+    result = stats["reply_latency"]
+    result["errors"] = stats["awaiting_reply"]
+    result["duration_s"] = round(duration, 3)
+    result["throughput_rps"] = round(result["requests"] / duration, 1)
+    return {"reply": result, "rate_limited": stats["rate_limited"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на бота через поддельный Bot API")
+    parser.add_argument("--fake-url", default="http://127.0.0.1:8765")
+    parser.add_argument("--text", default="/checkin")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--first-chat", type=int, default=1000000, help="Совпадает с контактами из generate_users")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=1.5,
+                        help="Секунд между раундами, не меньше лимита на чат")
+    parser.add_argument("--timeout", type=float, default=60, help="Сколько ждать ответов после последнего раунда")
+    parser.add_argument("--out", help="Куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_report(args.out, "bot", vars(args), results)
+
+if __name__ == "__main__":
+    main()
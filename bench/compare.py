@@ -0,0 +1,69 @@
+"""Сравнение двух отчётов бенчмарков (например, main и ветки).
+
+    python -m bench.compare base.json new.json --threshold 0.10
+
+Код возврата 1, если какая-то метрика ухудшилась больше чем на threshold.
+"""
+import argparse
+import json
+import sys
+
+# Метрика -> True, если больше значит лучше
+METRICS = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "duration_ms": False
+}
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(base, new, threshold):
+    """Строки сравнения и список регрессий"""
+    rows = []
+    regressions = []
+    for name, new_result in new["results"].items():
+        base_result = base["results"].get(name)
+        if not isinstance(new_result, dict) or not isinstance(base_result, dict):
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old_value = base_result.get(metric)
+            new_value = new_result.get(metric)
+            if not old_value or new_value is None:
+                continue
+
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            mark = "❌" if worse > threshold else "✅"
+            rows.append(f"{mark} {name}.{metric}: {old_value} -> {new_value} ({change:+.1%})")
+            if worse > threshold:
+                regressions.append(f"{name}.{metric}")
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение отчётов бенчмарков")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    if base["kind"] != new["kind"]:
+        print(f"❌ Отчёты разных типов: {base['kind']} и {new['kind']}")
+        sys.exit(2)
+
+    print(f"Сравнение {base.get('commit')} -> {new.get('commit')}")
+    rows, regressions = compare(base, new, args.threshold)
+    for row in rows:
+        print(row)
+
+    if regressions:
+        print(f"❌ Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ Регрессий нет")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Локальная замена api.telegram.org для нагрузочных тестов.
+
+    uvicorn bench.fake_telegram:app --port 8765
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8765/bot python -m backend.checker
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8765/bot python bot_server.py
+
+Записывает все sendMessage и отвечает 429 с retry_after при превышении
+лимитов Telegram (общего и на чат). Для bot_server.py отдаёт через
+getUpdates синтетические команды, добавленные через POST /inject, и
+считает задержку от команды до ответа бота.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from bench.report import summarize
+from notifier import TokenBucket
+
+# --- Конфигурация ---
+FAKE_GLOBAL_RATE = float(os.getenv("FAKE_TELEGRAM_GLOBAL_RATE", "30"))
+FAKE_CHAT_RATE = float(os.getenv("FAKE_TELEGRAM_CHAT_RATE", "1"))
+FAKE_LATENCY_MS = float(os.getenv("FAKE_TELEGRAM_LATENCY_MS", "0"))  # Имитация сетевой задержки
+FAKE_RETRY_AFTER = int(os.getenv("FAKE_TELEGRAM_RETRY_AFTER", "1"))
+SENT_LOG_SIZE = 100000
+GET_UPDATES_MAX_TIMEOUT = 10
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+def make_update(update_id, chat_id, text):
+    """Обновление с командой от пользователя chat_id, как его присылает Telegram"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": f"bench{chat_id}"},
+        "text": text
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+class FakeTelegram:
+    def __init__(self, global_rate=FAKE_GLOBAL_RATE, chat_rate=FAKE_CHAT_RATE):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.new_updates = asyncio.Event()
+        self.reset()
+
+    def reset(self):
+        self.global_bucket = TokenBucket(self.global_rate, capacity=self.global_rate)
+        self.chat_buckets = {}
+        self.sent = deque(maxlen=SENT_LOG_SIZE)
+        self.sent_total = 0
+        self.rate_limited = 0
+        self.calls = {}
+        self.updates = deque()
+        self.next_update_id = 1
+        self.injected_at = {}  # chat_id -> очередь времён отправки команд
+        self.reply_latencies = []
+
+    def throttle(self, chat_id):
+        """Секунд до снятия лимита или 0, если отправка разрешена"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+
+        now = time.monotonic()
+        wait = max(self.global_bucket.wait_time(now), bucket.wait_time(now))
+        if wait > 0:
+            return wait
+        self.global_bucket.take()
+        bucket.take()
+        return 0
+
+    def send_message(self, params):
+        chat_id = str(params["chat_id"])
+        if self.throttle(chat_id):
+            self.rate_limited += 1
+            return JSONResponse({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {FAKE_RETRY_AFTER}",
+                "parameters": {"retry_after": FAKE_RETRY_AFTER}
+            }, status_code=429)
+
+        now = time.time()
+        self.sent_total += 1
+        self.sent.append({"time": now, "chat_id": chat_id, "text": params.get("text", "")})
+
+        pending = self.injected_at.get(chat_id)
+        if pending:
+            self.reply_latencies.append(time.perf_counter() - pending.popleft())
+            if not pending:
+                del self.injected_at[chat_id]
+
+        return {"ok": True, "result": {
+            "message_id": self.sent_total,
+            "date": int(now),
+            "chat": {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", "")
+        }}
+
+    def inject(self, chat_ids, text):
+        for chat_id in chat_ids:
+            self.updates.append(make_update(self.next_update_id, chat_id, text))
+            self.next_update_id += 1
+            self.injected_at.setdefault(str(chat_id), deque()).append(time.perf_counter())
+        self.new_updates.set()
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), GET_UPDATES_MAX_TIMEOUT)
+
+        # offset подтверждает получение всех обновлений до него
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+
+        if not self.updates and timeout > 0:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return {"ok": True, "result": list(self.updates)[:limit]}
+
+    def stats(self):
+        return {
+            "sent": self.sent_total,
+            "rate_limited": self.rate_limited,
+            "calls": self.calls,
+            "pending_updates": len(self.updates),
+            "awaiting_reply": sum(len(pending) for pending in self.injected_at.values()),
+            "reply_latency": summarize(self.reply_latencies, 0)
+        }
+
+fake = FakeTelegram()
+app = FastAPI(title="Fake Telegram Bot API")
+
+async def read_params(request):
+    """Bot API принимает и JSON, и форму"""
+    body = await request.body()
+    if not body:
+        return dict(request.query_params)
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request):
+    params = await read_params(request)
+    fake.calls[method] = fake.calls.get(method, 0) + 1
+    if FAKE_LATENCY_MS:
+        await asyncio.sleep(FAKE_LATENCY_MS / 1000)
+
+    if method == "sendMessage":
+        return fake.send_message(params)
+    if method == "getUpdates":
+        return await fake.get_updates(params)
+    if method == "getMe":
+        return {"ok": True, "result": BOT_USER}
+    # deleteWebhook, setWebhook и прочее: достаточно успешного ответа
+    return {"ok": True, "result": True}
+
+@app.post("/inject")
+async def inject(request: Request):
+    """Добавить команды: {"text": "/checkin", "chats": 100, "first_chat": 1000000}"""
+    params = await request.json()
+    first_chat = int(params.get("first_chat", 1000000))
+    chats = int(params.get("chats", 1))
+    fake.inject(range(first_chat, first_chat + chats), params.get("text", "/checkin"))
+    return {"status": "ok", "injected": chats}
+
+@app.get("/sent")
+async def sent(limit: int = 100):
+    return list(fake.sent)[-limit:]
+
+@app.get("/stats")
+async def stats():
+    return fake.stats()
+
+@app.post("/reset")
+async def reset():
+    fake.reset()
+    return {"status": "ok"}
@@ -0,0 +1,68 @@
+"""Генератор синтетических пользователей для users.db.
+
+    python -m bench.generate_users --db bench.db --users 100000 --overdue 0.01
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from storage import ALARM_TIMEOUT, ensure_schema, hash_bucket
+
+CHUNK_SIZE = 10000
+
+def generate(db_path, users, overdue, contacts, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    ensure_schema(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+    next_seq = conn.execute("SELECT COALESCE(MAX(change_seq), 0) FROM users").fetchone()[0]
+    now = datetime.now()
+    started = time.perf_counter()
+
+    for start in range(0, users, CHUNK_SIZE):
+        rows = []
+        for i in range(start, min(users, start + CHUNK_SIZE)):
+            if rng.random() < overdue:
+                # Не отмечался дольше ALARM_TIMEOUT
+                checkin = now - ALARM_TIMEOUT - timedelta(seconds=rng.uniform(1, 3 * 24 * 3600))
+            else:
+                checkin = now - timedelta(seconds=rng.uniform(0, ALARM_TIMEOUT.total_seconds() - 60))
+            checkin_time = checkin.isoformat()
+            next_seq += 1
+            telegram_id = f"bench{next_id + i + 1}"
+            rows.append((
+                telegram_id,
+                f"user{i}",
+                str(1000000 + rng.randrange(contacts)),
+                checkin_time,
+                (checkin + ALARM_TIMEOUT).timestamp(),
+                hash_bucket(telegram_id),
+                next_seq
+            ))
+        conn.executemany(
+            "INSERT INTO users (telegram_id, name, contact_telegram_id, checkin_time, deadline, hash_bucket, change_seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+
+    conn.close()
+    print(f"✅ Добавлено {users} пользователей в {db_path} за {time.perf_counter() - started:.1f} с")
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение базы синтетическими пользователями")
+    parser.add_argument("--db", default="bench.db")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--overdue", type=float, default=0.01, help="Доля просроченных пользователей")
+    parser.add_argument("--contacts", type=int, default=1000, help="Сколько разных доверенных лиц")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.db, args.users, args.overdue, args.contacts, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Асинхронная нагрузка на API (main.py).
+
+    python -m bench.generate_users --db bench.db --users 100000
+    DB_PATH=bench.db uvicorn main:app --port 8000
+    python -m bench.load --scenario checkin --concurrency 100 --requests 20000 --out checkin.json
+
+Сценарии: register (новые пользователи), checkin и status (пользователи benchN
+из генератора), mixed (80% status, 19% checkin, 1% register).
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+import uuid
+
+import httpx
+
+from bench.report import summarize, write_report
+
+SCENARIOS = ("register", "checkin", "status", "mixed")
+
+class LoadDriver:
+    def __init__(self, client, users, conditional):
+        self.client = client
+        self.users = users
+        self.conditional = conditional
+        self.run_id = uuid.uuid4().hex[:8]
+        self.counter = itertools.count()
+        self.etags = {}
+        self.latencies = {}
+        self.errors = {}
+
+    def random_user(self):
+        return f"bench{random.randint(1, self.users)}"
+
+    async def register(self):
+        telegram_id = f"load-{self.run_id}-{next(self.counter)}"
+        response = await self.client.post("/register", json={
+            "telegram_id": telegram_id, "name": "bench", "contact_telegram_id": "1000000"
+        })
+        return response.status_code == 200 and response.json()["status"] == "ok"
+
+    async def checkin(self):
+        response = await self.client.post("/checkin", json={"telegram_id": self.random_user()})
+        return response.status_code == 200 and response.json()["status"] == "ok"
+
+    async def status(self):
+        telegram_id = self.random_user()
+        headers = {}
+        if self.conditional and telegram_id in self.etags:
+            headers["If-None-Match"] = self.etags[telegram_id]
+        response = await self.client.get(f"/status/{telegram_id}", headers=headers)
+        if response.status_code == 304:
+            return True
+        if "etag" in response.headers:
+            self.etags[telegram_id] = response.headers["etag"]
+        return response.status_code == 200 and response.json()["status"] != "error"
+
+    def pick(self, scenario):
+        if scenario != "mixed":
+            return scenario
+        roll = random.random()
+        if roll < 0.80:
+            return "status"
+        if roll < 0.99:
+            return "checkin"
+        return "register"
+
+    async def worker(self, scenario, deadline, remaining):
+        while time.perf_counter() < deadline and next(remaining) > 0:
+            name = self.pick(scenario)
+            started = time.perf_counter()
+            try:
+                ok = await getattr(self, name)()
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if ok:
+                self.latencies.setdefault(name, []).append(elapsed)
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        driver = LoadDriver(client, args.users, args.conditional)
+        remaining = itertools.count(args.requests, -1) if args.requests else itertools.repeat(1)
+        deadline = time.perf_counter() + args.duration if args.duration else float("inf")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            driver.worker(args.scenario, deadline, remaining) for _ in range(args.concurrency)
+        ))
+        duration = time.perf_counter() - started
+
+    results = {
+        name: summarize(latencies, duration, driver.errors.get(name, 0))
+        for name, latencies in driver.latencies.items()
+    }
+    for name, errors in driver.errors.items():
+        results.setdefault(name, summarize([], duration, errors))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на /register, /checkin и /status")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=10000, help="0 — ограничиться --duration")
+    parser.add_argument("--duration", type=float, default=0, help="Секунд; 0 — без ограничения")
+    parser.add_argument("--users", type=int, default=100000, help="Сколько пользователей benchN в базе")
+    parser.add_argument("--conditional", action="store_true", help="Слать If-None-Match в /status")
+    parser.add_argument("--out", help="Куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        parser.error("нужно указать --requests или --duration")
+
+    results = asyncio.run(run(args))
+    write_report(args.out, "load", vars(args), results)
+
+if __name__ == "__main__":
+    main()
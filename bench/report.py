@@ -0,0 +1,51 @@
+"""Общий формат отчётов бенчмарков: пропускная способность и перцентили задержек."""
+import json
+import platform
+import subprocess
+import time
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, duration, errors=0):
+    """Сводка по списку задержек (секунды) за duration секунд"""
+    values = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(values) / duration, 1) if duration > 0 else None,
+        "p50_ms": to_ms(percentile(values, 0.50)),
+        "p95_ms": to_ms(percentile(values, 0.95)),
+        "p99_ms": to_ms(percentile(values, 0.99)),
+        "max_ms": to_ms(values[-1] if values else None)
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_report(path, kind, params, results):
+    """Отчёт с параметрами запуска и коммитом, чтобы сравнивать между версиями"""
+    report = {
+        "kind": kind,
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return report
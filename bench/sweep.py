@@ -0,0 +1,87 @@
+"""Замер одного прохода проверки (backend/checker.py) на синтетической базе.
+
+    python -m bench.generate_users --db bench.db --users 100000 --overdue 0.01
+    DB_PATH=bench.db python -m bench.sweep --out sweep.json
+
+Меряет загрузку первого окна планировщика, отбор и запись тревог через
+журнал и чтение ленты изменений с нуля. С --deliver ещё и доставку тревог
+через поддельный Bot API (bench/fake_telegram.py должен быть запущен).
+Перед замером журнал тревог и outbox очищаются, база меняется.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+
+# Бенчмарк не должен достучаться до настоящего Telegram
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+os.environ.setdefault("TELEGRAM_API_BASE_URL", "http://127.0.0.1:8765/bot")
+
+from backend.checker import StatusChecker
+from bench.report import write_report
+from storage import DB_PATH
+
+def reset_ledger(db_path):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE users SET alarm_sent_at = NULL WHERE alarm_sent_at IS NOT NULL")
+        conn.execute("DELETE FROM outbox")
+    conn.close()
+
+def phase(results, name, started, **extra):
+    results[name] = {"duration_ms": round((time.perf_counter() - started) * 1000, 3), **extra}
+
+async def sweep(args):
+    checker = StatusChecker()
+    results = {}
+    await checker.storage.open()
+    try:
+        started = time.perf_counter()
+        await checker.scheduler.load_next_window(time.time())
+        phase(results, "load_window", started, users_scanned=len(checker.scheduler))
+
+        started = time.perf_counter()
+        due = checker.scheduler.pop_due(time.time())
+        alarms, notifications = await checker.storage.claim_alarms(
+            [telegram_id for telegram_id, _ in due], time.time(), checker.build_alarm
+        )
+        phase(results, "claim_alarms", started, due=len(due), alarms=alarms)
+
+        started = time.perf_counter()
+        changes = 0
+        while True:
+            page = await checker.storage.changes_since(checker.change_seq)
+            changes += len(page)
+            if not page:
+                break
+            checker.change_seq = page[-1][3]
+        phase(results, "change_feed", started, changes=changes)
+
+        if args.deliver:
+            started = time.perf_counter()
+            # Заявленные тревоги уже лежат в outbox, start() их поднимет
+            await checker.dispatcher.start()
+            deadline = time.monotonic() + args.deliver_timeout
+            while len(checker.dispatcher) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            phase(results, "deliver", started, messages=len(notifications),
+                  undelivered=len(checker.dispatcher))
+            await checker.dispatcher.stop()
+    finally:
+        await checker.storage.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер прохода проверки статусов")
+    parser.add_argument("--deliver", action="store_true", help="Отправить тревоги в поддельный Bot API")
+    parser.add_argument("--deliver-timeout", type=float, default=300)
+    parser.add_argument("--out", help="Куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    reset_ledger(DB_PATH)
+    results = asyncio.run(sweep(args))
+    write_report(args.out, "sweep", {"db": DB_PATH, **vars(args)}, results)
+
+if __name__ == "__main__":
+    main()
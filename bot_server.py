@@ -1,12 +1,39 @@
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram import Update
-import requests
 import asyncio
+import functools
 import os
 from config import TELEGRAM_BOT_TOKEN
+from api_client import create_api_client
+from bot_updates import ChatOrderedUpdateProcessor
+from metrics import BOT_HANDLER_ERRORS, BOT_HANDLER_SECONDS, start_metrics_server
+from notifier import TELEGRAM_API_BASE_URL
+
+# Один клиент API на все обработчики: соединения переиспользуются
+api_client = create_api_client()
+metrics_server = None
+
+async def start_metrics(application: Application):
+    # В режиме webhook бот живёт в main.py, и метрики отдаёт его /metrics
+    global metrics_server
+    metrics_server = await start_metrics_server()
+
+async def close_api_client(application: Application):
+    if metrics_server is not None:
+        metrics_server.close()
+    await api_client.close()
 
 # Создаем приложение Telegram
-bot_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+# Обновления разных пользователей обрабатываются параллельно, одного — по порядку (BOT_CONCURRENCY)
+bot_app = (
+    Application.builder()
+    .token(TELEGRAM_BOT_TOKEN)
+    .base_url(TELEGRAM_API_BASE_URL)
+    .concurrent_updates(ChatOrderedUpdateProcessor())
+    .post_init(start_metrics)
+    .post_shutdown(close_api_client)
+    .build()
+)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
@@ -37,16 +64,8 @@ async def register_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = context.args[0]
     contact_id = context.args[1]
 
-    payload = {
-        "telegram_id": user_id,
-        "name": name,
-        "contact_telegram_id": contact_id
-    }
-    
     try:
-        # Заменено на URL Railway
-        response = requests.post("https://vse-v-poryadke-production.up.railway.app/register", json=payload)
-        data = response.json()
+        data = await api_client.register(user_id, name, contact_id)
         
         if data["status"] == "ok":
             await context.bot.send_message(
@@ -68,12 +87,8 @@ async def checkin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     chat_id = update.effective_chat.id
     
-    payload = {"telegram_id": user_id}
-    
     try:
-        # Заменено на URL Railway
-        response = requests.post("https://vse-v-poryadke-production.up.railway.app/checkin", json=payload)
-        data = response.json()
+        data = await api_client.checkin(user_id)
         
         if data["status"] == "ok":
             await context.bot.send_message(
@@ -91,10 +106,25 @@ async def checkin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text=f"❌ Ошибка подключения к серверу: {str(e)}"
         )
 
+def instrumented(handler):
+    """Время обработки команды и необработанные ошибки в метриках"""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            with BOT_HANDLER_SECONDS.labels(name).time():
+                await handler(update, context)
+        except Exception:
+            BOT_HANDLER_ERRORS.labels(name).inc()
+            raise
+
+    return wrapper
+
 # Регистрация обработчиков
-bot_app.add_handler(CommandHandler("start", start))
-bot_app.add_handler(CommandHandler("register", register_cmd))
-bot_app.add_handler(CommandHandler("checkin", checkin_cmd))
+bot_app.add_handler(CommandHandler("start", instrumented(start)))
+bot_app.add_handler(CommandHandler("register", instrumented(register_cmd)))
+bot_app.add_handler(CommandHandler("checkin", instrumented(checkin_cmd)))
 
 if __name__ == "__main__":
     asyncio.run(bot_app.run_polling())
\ No newline at end of file
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import BOT_UPDATE_WAIT_SECONDS, BOT_UPDATES_IN_PROGRESS, BOT_UPDATES_QUEUED, BOT_UPDATES_SHED
+
+# --- Конфигурация ---
+BOT_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", "16"))  # Обновлений в обработке одновременно
+BOT_MAX_QUEUED_UPDATES = int(os.getenv("BOT_MAX_QUEUED_UPDATES", "1000"))  # Сверх этого — отказ
+# Базовый класс ограничивает обновления до разбора по чатам; настоящий предел — BOT_CONCURRENCY
+UNBOUNDED_ADMISSION = 2 ** 31
+BUSY_MESSAGE = "⏳ Бот перегружен, повторите команду через минуту."
+
+def chat_key(update):
+    """Ключ очерёдности: обновления одного чата обрабатываются по порядку"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений бота в режиме polling.
+
+    Обновления разных чатов идут одновременно, не больше concurrency сразу;
+    обновления одного чата ждут друг друга по порядку поступления, поэтому
+    /checkin не обгонит /register. Ждущее своей очереди обновление не занимает
+    место обработки. Если в очереди больше max_queued обновлений, новые
+    отбрасываются, а пользователь получает просьбу повторить команду.
+    """
+
+    def __init__(self, concurrency=BOT_CONCURRENCY, max_queued=BOT_MAX_QUEUED_UPDATES):
+        super().__init__(UNBOUNDED_ADMISSION)
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.slots = asyncio.Semaphore(concurrency)
+        self.chats = {}  # ключ чата -> [asyncio.Lock, обновлений этого чата в работе]
+        self.queued = 0
+        self.running = 0
+
+    async def initialize(self):
+        BOT_UPDATES_QUEUED.labels("polling").set_function(lambda: self.queued)
+        BOT_UPDATES_IN_PROGRESS.labels("polling").set_function(lambda: self.running)
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        if self.queued >= self.max_queued:
+            coroutine.close()
+            BOT_UPDATES_SHED.labels("polling").inc()
+            await self.reject(update)
+            return
+
+        key = chat_key(update)
+        chat = self.chats.get(key)
+        if chat is None:
+            chat = self.chats[key] = [asyncio.Lock(), 0]
+        chat[1] += 1
+        self.queued += 1
+        queued_at = time.perf_counter()
+        started = False
+
+        try:
+            # Lock отдаётся ждущим в порядке очереди, а задачи создаются в порядке поступления
+            async with chat[0]:
+                async with self.slots:
+                    self.queued -= 1
+                    self.running += 1
+                    started = True
+                    BOT_UPDATE_WAIT_SECONDS.labels("polling").observe(time.perf_counter() - queued_at)
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+        finally:
+            if not started:
+                # Отменено в очереди: обработчик так и не запускался
+                self.queued -= 1
+                coroutine.close()
+            chat[1] -= 1
+            if not chat[1]:
+                del self.chats[key]
+
+    async def reject(self, update):
+        message = getattr(update, "effective_message", None)
+        if message is None:
+            return
+        try:
+            await message.reply_text(BUSY_MESSAGE)
+        except Exception as e:
+            print(f"❌ Не удалось ответить о перегрузке: {e}")
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from scheduler import DeadlineScheduler
+from status_cache import build_status_entry
+
+# --- Конфигурация ---
+STREAM_QUEUE_SIZE = 100  # Событий на одного подписчика, при переполнении выбрасываются старые
+
+class StatusBroker:
+    """Рассылка изменений статуса подписчикам внутри процесса.
+
+    Подписчик следит за набором telegram_id. Событие уходит, когда ответ
+    /status для пользователя меняется: после отметки или регистрации и в
+    момент наступления дедлайна (планировщик держит только отслеживаемых).
+    """
+
+    def __init__(self, storage, queue_size=STREAM_QUEUE_SIZE):
+        self.storage = storage
+        self.queue_size = queue_size
+        self.subscribers = {}  # telegram_id -> множество очередей
+        self.last = {}  # telegram_id -> последнее разосланное событие
+        # Обновления идут параллельно: результат чтения, начатого раньше уже применённого, устарел
+        self.refresh_seq = 0
+        self.applied_seq = {}  # telegram_id -> номер последнего применённого обновления
+        self.scheduler = DeadlineScheduler(None)
+        self.pending = set()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.scheduler.run(self.on_due))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, *self.pending, return_exceptions=True)
+            self.task = None
+
+    def offer(self, queue, event):
+        if queue.full():
+            # Медленный клиент: важнее последний статус, чем старые
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def subscribe(self, telegram_ids):
+        """Новая подписка: сразу получает текущие статусы"""
+        queue = asyncio.Queue(maxsize=max(self.queue_size, len(telegram_ids)))
+        for telegram_id in telegram_ids:
+            self.subscribers.setdefault(telegram_id, set()).add(queue)
+
+        for telegram_id in telegram_ids:
+            if telegram_id in self.last:
+                self.offer(queue, self.last[telegram_id])
+
+        try:
+            await self.refresh([telegram_id for telegram_id in telegram_ids if telegram_id not in self.last], queue)
+        except BaseException:
+            self.unsubscribe(telegram_ids, queue)
+            raise
+        return queue
+
+    def unsubscribe(self, telegram_ids, queue):
+        for telegram_id in telegram_ids:
+            queues = self.subscribers.get(telegram_id)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[telegram_id]
+                self.last.pop(telegram_id, None)
+                self.applied_seq.pop(telegram_id, None)
+                self.scheduler.cancel(telegram_id)
+
+    def publish(self, telegram_ids):
+        """Пользователи изменились (отметка, регистрация): обновить тех, за кем следят"""
+        watched = [telegram_id for telegram_id in telegram_ids if telegram_id in self.subscribers]
+        if not watched:
+            return
+
+        task = asyncio.create_task(self.refresh(watched))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def on_due(self, due):
+        await self.refresh([telegram_id for telegram_id, _ in due])
+
+    async def refresh(self, telegram_ids, queue=None):
+        """Перечитать статусы и разослать изменившиеся. queue получает статус в любом случае"""
+        telegram_ids = [telegram_id for telegram_id in telegram_ids if telegram_id in self.subscribers]
+        if not telegram_ids:
+            return
+
+        self.refresh_seq += 1
+        seq = self.refresh_seq
+        now = time.time()
+        users = {
+            user["telegram_id"]: user
+            for user in await self.storage.get_users_by_telegram_ids(telegram_ids)
+        }
+
+        for telegram_id in telegram_ids:
+            if telegram_id not in self.subscribers:
+                continue
+            if self.applied_seq.get(telegram_id, 0) > seq:
+                # Более позднее чтение уже разослано и поставило дедлайн; queue получила его вместе со всеми
+                continue
+            self.applied_seq[telegram_id] = seq
+
+            user = users.get(telegram_id)
+            if user is None:
+                event = {"telegram_id": telegram_id, "status": "error", "message": "Пользователь не найден"}
+                self.scheduler.cancel(telegram_id)
+            else:
+                entry = build_status_entry(user, now)
+                event = {"telegram_id": telegram_id, **entry["body"]}
+                if entry["flips_at"] is not None:
+                    self.scheduler.schedule(telegram_id, entry["flips_at"])
+                else:
+                    self.scheduler.cancel(telegram_id)
+
+            if self.last.get(telegram_id) != event:
+                self.last[telegram_id] = event
+                for subscriber in self.subscribers[telegram_id]:
+                    self.offer(subscriber, event)
+            elif queue is not None:
+                self.offer(queue, event)
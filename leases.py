@@ -0,0 +1,85 @@
+import math
+import os
+import socket
+import time
+import uuid
+
+from storage import HASH_BUCKETS
+
+# --- Конфигурация ---
+CHECKER_PARTITIONS = int(os.getenv("CHECKER_PARTITIONS", "16"))  # Не больше HASH_BUCKETS
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "15"))  # Аренда без продления истекает
+
+def partition_ranges(count):
+    """Разделы как диапазоны корзин: [(partition, bucket_lo, bucket_hi)]"""
+    if not 1 <= count <= HASH_BUCKETS:
+        raise ValueError(f"CHECKER_PARTITIONS должно быть от 1 до {HASH_BUCKETS}")
+    return [
+        (partition, partition * HASH_BUCKETS // count, (partition + 1) * HASH_BUCKETS // count - 1)
+        for partition in range(count)
+    ]
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+class PartitionLeases:
+    """Аренда разделов пользователей проверяющим процессом.
+
+    Каждый процесс раз в ttl / 3 отмечается живым, продлевает свои аренды и
+    доводит их число до поровну между живыми процессами: лишние отдаёт,
+    недостающие берёт из свободных или просроченных. Умерший процесс перестаёт
+    продлевать аренды, и через ttl их разбирают остальные.
+    """
+
+    def __init__(self, storage, partitions=CHECKER_PARTITIONS, ttl=LEASE_TTL_SECONDS, worker_id=None):
+        self.storage = storage
+        self.partitions = partitions
+        self.ttl = ttl
+        self.worker_id = worker_id or make_worker_id()
+        self.owned = []  # [(partition, bucket_lo, bucket_hi)]
+        self.live_workers = 1  # Живые процессы на последнем продлении
+
+    @property
+    def heartbeat_interval(self):
+        # Одна пропущенная попытка продления ещё не теряет аренду
+        return self.ttl / 3
+
+    def buckets(self):
+        return {
+            bucket
+            for _, bucket_lo, bucket_hi in self.owned
+            for bucket in range(bucket_lo, bucket_hi + 1)
+        }
+
+    async def start(self):
+        await self.storage.ensure_partitions(partition_ranges(self.partitions), time.time())
+
+    async def tick(self, before_release):
+        """Продление и перераспределение. True — набор разделов изменился.
+
+        before_release() вызывается до того, как разделы уйдут другому процессу:
+        к этому моменту работа по ним должна быть остановлена.
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        live_workers = self.live_workers = await self.storage.heartbeat_worker(self.worker_id, now, self.ttl)
+        owned = await self.storage.renew_leases(self.worker_id, now, expires_at)
+        target = math.ceil(self.partitions / max(live_workers, 1))
+
+        if len(owned) > target:
+            await before_release()
+            await self.storage.release_leases(self.worker_id, [partition for partition, _, _ in owned[target:]])
+            owned = owned[:target]
+        elif len(owned) < target:
+            owned = sorted(owned + await self.storage.acquire_leases(
+                self.worker_id, now, expires_at, target - len(owned)
+            ))
+
+        changed = owned != self.owned
+        self.owned = owned
+        return changed
+
+    async def stop(self):
+        """Отдать все разделы сразу: остальные заберут их на следующем продлении"""
+        self.owned = []
+        await self.storage.remove_worker(self.worker_id)
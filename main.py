@@ -1,13 +1,149 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-import sqlite3
-from datetime import datetime, timedelta
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import json
 import os
+import time
 from fastapi.middleware.cors import CORSMiddleware
+from telegram import Update
+from events import StatusBroker
+from metrics import CONTENT_TYPE, REGISTRY, STATUS_CACHE_ENTRIES, STATUS_CACHE_LOOKUPS, MetricsMiddleware
+from profiler import create_profiler
+from status_cache import StatusCache, build_status_entry, is_not_modified
+from storage import Storage
+from transfer import FORMATS, MEDIA_TYPES, export_stream, import_stream
+from webhook import UpdatePipeline
+
+# --- Работа с базой данных ---
+# Соединения открываются один раз при старте приложения и живут до остановки
+storage = Storage()
+# Вычисленные статусы для /status: сбрасываются при отметке и регистрации
+status_cache = StatusCache()
+STATUS_CACHE_LOOKUPS.labels("hit").set_function(lambda: status_cache.hits)
+STATUS_CACHE_LOOKUPS.labels("miss").set_function(lambda: status_cache.misses)
+STATUS_CACHE_ENTRIES.set_function(status_cache.__len__)
+# Подписки /status/stream: изменения статусов рассылаются без опроса
+status_broker = StatusBroker(storage)
+STREAM_KEEPALIVE_SECONDS = 15
+# Стеки медленных запросов в лог: включается PROFILE_SLOW_REQUESTS_MS
+profiler = create_profiler()
+
+# --- Webhook Telegram ---
+# WEBHOOK_MODE=1: обновления бота приходят на /webhook этого процесса вместо run_polling()
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "0") == "1"
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+update_pipeline = None
+
+# --- Администрирование ---
+# Массовая загрузка и выгрузка доступны только с ADMIN_TOKEN (заголовок Authorization: Bearer ...)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# --- Один процесс ---
+# COMBINED_MODE=1: бот и проверка статусов работают в этом процессе на том же цикле событий.
+# База и клиент Telegram общие, команды бота вызывают маршруты API как функции (API_MODE=local)
+COMBINED_MODE = os.getenv("COMBINED_MODE", "0") == "1"
+# Упавшую проверку перезапускаем сами: процесс API продолжает работать, и Procfile его не перезапустит
+CHECKER_RESTART_MIN_SECONDS = 1
+CHECKER_RESTART_MAX_SECONDS = 60
+checker_task = None
+
+async def start_bot():
+    global update_pipeline
+
+    if WEBHOOK_MODE and not WEBHOOK_SECRET:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET не найден в переменных окружения")
+
+    # Импорт здесь: без бота API не требует токена
+    from bot_server import bot_app
+
+    await bot_app.initialize()
+    await bot_app.start()
+    if WEBHOOK_MODE:
+        update_pipeline = UpdatePipeline(bot_app)
+        update_pipeline.start()
+    else:
+        await bot_app.updater.start_polling()
+    return bot_app
+
+async def stop_bot(application):
+    global update_pipeline
+
+    if update_pipeline is not None:
+        await update_pipeline.stop()
+        update_pipeline = None
+    if application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    # post_shutdown сам вызывается только из run_polling()/run_webhook(): закрываем клиент API бота
+    if application.post_shutdown is not None:
+        await application.post_shutdown(application)
+
+async def supervise_checker(bot):
+    """Проверка статусов с перезапуском: без неё тревоги перестали бы уходить молча"""
+    from backend.checker import StatusChecker
+
+    delay = CHECKER_RESTART_MIN_SECONDS
+    while True:
+        started = time.monotonic()
+        error = None
+        try:
+            # Метрики проверки отдаёт /metrics этого процесса
+            await StatusChecker(storage, bot).run_checker(metrics_port=0)
+        except Exception as e:
+            error = e
+        # Долго проработавшая проверка начинает отсчёт паузы заново
+        if time.monotonic() - started > CHECKER_RESTART_MAX_SECONDS:
+            delay = CHECKER_RESTART_MIN_SECONDS
+        print(f"❌ Проверка статусов остановилась ({error!r}). Перезапуск через {delay} с")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, CHECKER_RESTART_MAX_SECONDS)
+
+def on_checker_done(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Надзор за проверкой статусов остановился: {task.exception()!r}")
+
+async def start_checker(bot):
+    global checker_task
+
+    checker_task = asyncio.create_task(supervise_checker(bot))
+    checker_task.add_done_callback(on_checker_done)
+
+async def stop_checker():
+    global checker_task
+
+    # Отмена доходит до finally в run_checker: аренды разделов отдаются сразу
+    checker_task.cancel()
+    await asyncio.gather(checker_task, return_exceptions=True)
+    checker_task = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await storage.open()
+    status_broker.start()
+    if profiler is not None:
+        profiler.start()
+    bot_app = None
+    if WEBHOOK_MODE or COMBINED_MODE:
+        bot_app = await start_bot()
+    if COMBINED_MODE:
+        await start_checker(bot_app.bot)
+    yield
+    if checker_task is not None:
+        await stop_checker()
+    if bot_app is not None:
+        await stop_bot(bot_app)
+    if profiler is not None:
+        profiler.stop()
+    await status_broker.stop()
+    await storage.close()
 
 # --- Конфигурация ---
-app = FastAPI(title="Всё в порядке?", version="0.1.0")
+app = FastAPI(title="Всё в порядке?", version="0.1.0", lifespan=lifespan)
 
 # --- Настройка CORS ---
 app.add_middleware(
@@ -18,6 +154,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Метрики ---
+app.add_middleware(MetricsMiddleware, profiler=profiler)
+
 # --- Модель для запросов ---
 class RegisterRequest(BaseModel):
     telegram_id: str
@@ -27,77 +166,29 @@ class RegisterRequest(BaseModel):
 class CheckinRequest(BaseModel):
     telegram_id: str
 
-# --- Работа с базой данных ---
-DB_PATH = "users.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            contact_telegram_id TEXT,
-            checkin_time TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def get_user_by_telegram_id(telegram_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            "id": row[0],
-            "telegram_id": row[1],
-            "name": row[2],
-            "contact_telegram_id": row[3],
-            "checkin_time": row[4]
-        }
-    return None
+# Пакетные запросы: не больше BATCH_MAX_SIZE элементов за раз
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
 
-def update_checkin_time(telegram_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET checkin_time = ? WHERE telegram_id = ?", 
-                   (datetime.now().isoformat(), telegram_id))
-    conn.commit()
-    conn.close()
-
-def register_user(telegram_id: str, name: str, contact_telegram_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO users (telegram_id, name, contact_telegram_id) 
-            VALUES (?, ?, ?)
-        """, (telegram_id, name, contact_telegram_id))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.IntegrityError:
-        conn.close()
-        return False
+class RegisterBatchRequest(BaseModel):
+    items: List[RegisterRequest] = Field(max_length=BATCH_MAX_SIZE)
 
-# --- API маршруты ---
-@app.on_event("startup")
-async def startup_event():
-    init_db()
+class CheckinBatchRequest(BaseModel):
+    items: List[CheckinRequest] = Field(max_length=BATCH_MAX_SIZE)
 
+class StatusBatchRequest(BaseModel):
+    telegram_ids: List[str] = Field(max_length=BATCH_MAX_SIZE)
+
+# --- API маршруты ---
 @app.post("/register")
 async def register_endpoint(data: RegisterRequest):
-    user = get_user_by_telegram_id(data.telegram_id)
+    user = await storage.get_user_by_telegram_id(data.telegram_id)
     
     if user:
         return {"status": "error", "message": "Пользователь уже зарегистрирован"}
     
-    success = register_user(data.telegram_id, data.name, data.contact_telegram_id)
+    success = await storage.register_user(data.telegram_id, data.name, data.contact_telegram_id)
+    status_cache.invalidate(data.telegram_id)
+    status_broker.publish([data.telegram_id])
     
     if success:
         return {"status": "ok", "user_id": data.telegram_id}
@@ -106,33 +197,206 @@ async def register_endpoint(data: RegisterRequest):
 
 @app.post("/checkin")
 async def checkin_endpoint(data: CheckinRequest):
-    user = get_user_by_telegram_id(data.telegram_id)
+    user = await storage.get_user_by_telegram_id(data.telegram_id)
     
     if not user:
         return {"status": "error", "message": "Пользователь не найден"}
     
-    update_checkin_time(data.telegram_id)
+    await storage.update_checkin_time(data.telegram_id)
+    status_cache.invalidate(data.telegram_id)
+    status_broker.publish([data.telegram_id])
     
     return {"status": "ok", "message": "Отметка обновлена"}
 
+# Объявлен раньше /status/{telegram_id}, иначе "stream" примется за telegram_id
+@app.get("/status/stream")
+async def status_stream(ids: str):
+    """Server-Sent Events: текущие статусы, затем каждое их изменение"""
+    telegram_ids = list(dict.fromkeys(telegram_id.strip() for telegram_id in ids.split(",") if telegram_id.strip()))
+    if not telegram_ids or len(telegram_ids) > BATCH_MAX_SIZE:
+        return JSONResponse(
+            {"status": "error", "message": f"Укажите от 1 до {BATCH_MAX_SIZE} ID через запятую"},
+            status_code=400
+        )
+
+    async def events():
+        # Подписка внутри генератора: если клиент ушёл до первой итерации, подписки и не было
+        queue = None
+        try:
+            queue = await status_broker.subscribe(telegram_ids)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            if queue is not None:
+                status_broker.unsubscribe(telegram_ids, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/status/{telegram_id}")
-async def get_status(telegram_id: str):
-    user = get_user_by_telegram_id(telegram_id)
-    
-    if not user:
-        return {"status": "error", "message": "Пользователь не найден"}
-    
-    last_checkin = user["checkin_time"]
-    last_checkin_dt = datetime.fromisoformat(last_checkin)
-    time_diff = datetime.now() - last_checkin_dt
-    
-    status = "ALARM" if time_diff > timedelta(hours=24) else "OK"
-    
-    return {
-        "status": status,
-        "last_checkin": last_checkin,
-        "contact_telegram_id": user["contact_telegram_id"]
-    }
+async def get_status(telegram_id: str, request: Request):
+    now = time.time()
+    entry = status_cache.get(telegram_id, now)
+
+    if entry is None:
+        token = status_cache.read_token()
+        user = await storage.get_user_by_telegram_id(telegram_id)
+
+        if not user:
+            return {"status": "error", "message": "Пользователь не найден"}
+
+        entry = build_status_entry(user, now)
+        status_cache.put(telegram_id, entry, now, token)
+
+    # Повторный опрос без изменений: ни базы, ни тела ответа
+    if is_not_modified(request.headers, entry):
+        return Response(status_code=304, headers=entry["headers"])
+
+    return JSONResponse(entry["body"], headers=entry["headers"])
+
+# --- Пакетные маршруты ---
+@app.post("/register/batch")
+async def register_batch_endpoint(data: RegisterBatchRequest):
+    registered = await storage.register_users(
+        [(item.telegram_id, item.name, item.contact_telegram_id) for item in data.items]
+    )
+
+    results = []
+    for item in data.items:
+        status_cache.invalidate(item.telegram_id)
+        if item.telegram_id in registered:
+            registered.discard(item.telegram_id)
+            results.append({"telegram_id": item.telegram_id, "status": "ok", "user_id": item.telegram_id})
+        else:
+            results.append({"telegram_id": item.telegram_id, "status": "error", "message": "Пользователь уже зарегистрирован"})
+
+    status_broker.publish([item.telegram_id for item in data.items])
+    return {"status": "ok", "results": results}
+
+@app.post("/checkin/batch")
+async def checkin_batch_endpoint(data: CheckinBatchRequest):
+    updated = await storage.checkin_users([item.telegram_id for item in data.items])
+
+    results = []
+    for item in data.items:
+        if item.telegram_id in updated:
+            status_cache.invalidate(item.telegram_id)
+            results.append({"telegram_id": item.telegram_id, "status": "ok", "message": "Отметка обновлена"})
+        else:
+            results.append({"telegram_id": item.telegram_id, "status": "error", "message": "Пользователь не найден"})
+
+    status_broker.publish(updated)
+    return {"status": "ok", "results": results}
+
+@app.post("/status/batch")
+async def status_batch_endpoint(data: StatusBatchRequest):
+    now = time.time()
+    entries = {}
+    missing = []
+
+    for telegram_id in data.telegram_ids:
+        entry = status_cache.get(telegram_id, now)
+        if entry is None:
+            missing.append(telegram_id)
+        else:
+            entries[telegram_id] = entry
+
+    if missing:
+        token = status_cache.read_token()
+        for user in await storage.get_users_by_telegram_ids(set(missing)):
+            entry = build_status_entry(user, now)
+            status_cache.put(user["telegram_id"], entry, now, token)
+            entries[user["telegram_id"]] = entry
+
+    results = []
+    for telegram_id in data.telegram_ids:
+        entry = entries.get(telegram_id)
+        if entry is None:
+            results.append({"telegram_id": telegram_id, "status": "error", "message": "Пользователь не найден"})
+        else:
+            results.append({"telegram_id": telegram_id, **entry["body"]})
+
+    return {"status": "ok", "results": results}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return status_cache.stats()
+
+def check_admin(request: Request):
+    """Ответ с ошибкой, если запрос не от администратора, иначе None"""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"status": "error", "message": "Администрирование выключено"}, status_code=404)
+
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse({"status": "error", "message": "Неверный токен"}, status_code=403)
+    return None
+
+def on_imported(telegram_ids):
+    # Загрузка могла изменить любого пользователя
+    status_cache.clear()
+    status_broker.publish(telegram_ids)
+
+@app.post("/admin/import")
+async def admin_import(request: Request, format: str = "ndjson", update: bool = False):
+    """Тело запроса — файл NDJSON или CSV, читается потоком"""
+    error = check_admin(request)
+    if error is not None:
+        return error
+    if format not in FORMATS:
+        return JSONResponse({"status": "error", "message": f"Формат: {', '.join(FORMATS)}"}, status_code=400)
+
+    stats = await import_stream(storage, request.stream(), format, update, on_imported)
+    return {"status": "ok", **stats}
+
+@app.get("/admin/export")
+async def admin_export(request: Request, format: str = "ndjson"):
+    error = check_admin(request)
+    if error is not None:
+        return error
+    if format not in FORMATS:
+        return JSONResponse({"status": "error", "message": f"Формат: {', '.join(FORMATS)}"}, status_code=400)
+
+    return StreamingResponse(
+        export_stream(storage, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'}
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.post("/webhook")
+async def webhook_endpoint(request: Request):
+    if update_pipeline is None:
+        return JSONResponse({"status": "error", "message": "Webhook выключен"}, status_code=404)
+
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+        return JSONResponse({"status": "error", "message": "Неверный секрет"}, status_code=403)
+
+    try:
+        data = await request.json()
+        update = Update.de_json(data, update_pipeline.application.bot) if isinstance(data, dict) else None
+    except (ValueError, TypeError, KeyError, AttributeError):
+        update = None
+    if update is None:
+        return JSONResponse({"status": "error", "message": "Неверное обновление"}, status_code=400)
+
+    # Отвечаем сразу, обработка идёт в фоне. При переполнении Telegram повторит доставку
+    if not update_pipeline.submit(update):
+        return JSONResponse({"status": "error", "message": "Очередь переполнена"}, status_code=503)
+
+    return {"status": "ok"}
 
 # --- Корневой маршрут ---
 @app.get("/")
@@ -0,0 +1,303 @@
+import asyncio
+import bisect
+import os
+import time
+from contextlib import contextmanager
+
+# --- Конфигурация ---
+# Порт /metrics для процессов без HTTP (checker, бот в режиме polling); 0 — не поднимать
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин по умолчанию, секунды: от 1 мс до 10 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# --- Метрики ---
+class CounterChild:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Значение вычисляется при каждой выгрузке (размер очереди и т.п.)"""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+class Metric:
+    """Метрика с метками. Значения меняются только из цикла событий, без блокировок"""
+    kind = None
+    child_class = None
+    child_args = ()  # Аргументы для child_class: у гистограммы — границы корзин
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        # Метрика без меток ведёт себя как её единственное значение: counter.inc()
+        self.default = None if self.labelnames else self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def new_child(self):
+        return self.child_class(*self.child_args)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+            child = self.children[values] = self.new_child()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(self.render_child(values, child))
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+    child_class = CounterChild
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def render_child(self, values, child):
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"]
+
+class Gauge(Metric):
+    kind = "gauge"
+    child_class = GaugeChild
+
+    def set(self, value):
+        self.default.set(value)
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def dec(self, amount=1):
+        self.default.dec(amount)
+
+    def set_function(self, function):
+        self.default.set_function(function)
+
+    def render_child(self, values, child):
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.get())}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+    child_class = HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self.child_args = (self.buckets,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self.default.observe(value)
+
+    def time(self):
+        return self.default.time()
+
+    def render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = format_labels(self.labelnames, values, f'le="{format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Отдача /metrics без веб-фреймворка ---
+async def handle_metrics_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, REGISTRY.render().encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(port=METRICS_PORT):
+    """Поднять /metrics на отдельном порту. None, если порт не задан"""
+    if not port:
+        return None
+    server = await asyncio.start_server(handle_metrics_request, "0.0.0.0", port)
+    print(f"📈 Метрики доступны на :{port}/metrics")
+    return server
+
+# --- Метрики приложения ---
+# Все метрики объявлены здесь: модуль можно импортировать из любого процесса без повторной регистрации
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Время до начала ответа по маршрутам API", ("method", "route")
+)
+HTTP_REQUESTS = Counter("http_requests_total", "Запросы к API по маршрутам и кодам ответа", ("method", "route", "status"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Запросы к API в обработке")
+
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Время операций с базой, включая commit", ("op",))
+DB_WAIT_SECONDS = Histogram(
+    "db_wait_seconds", "Ожидание соединения из пула или блокировки писателя", ("kind",)
+)
+DB_CONNECTIONS_OPENED = Counter("db_connections_opened_total", "Открытые соединения с базой", ("kind",))
+DB_CHECKIN_BATCH_SIZE = Histogram(
+    "db_checkin_batch_size", "Отметок в одной групповой записи", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+CHECKER_CYCLE_SECONDS = Histogram("checker_cycle_duration_seconds", "Обработка наступивших дедлайнов за цикл")
+CHECKER_DUE_USERS = Counter("checker_due_users_total", "Пользователи с наступившим дедлайном")
+CHECKER_ALARMS = Counter("checker_alarms_total", "Поднятые тревоги")
+CHECKER_WINDOW_SECONDS = Histogram("checker_window_load_duration_seconds", "Загрузка окна дедлайнов из базы")
+CHECKER_USERS_SCANNED = Counter("checker_users_scanned_total", "Пользователи, прочитанные окнами планировщика")
+CHECKER_CHANGES = Counter("checker_change_feed_rows_total", "Строки, прочитанные из ленты изменений")
+CHECKER_SCHEDULED = Gauge("checker_scheduled_users", "Дедлайны в памяти планировщика")
+
+# Значения берутся из StatusCache при выгрузке (set_function)
+STATUS_CACHE_LOOKUPS = Gauge("status_cache_lookups", "Обращения к кэшу статусов с запуска: hit или miss", ("result",))
+STATUS_CACHE_ENTRIES = Gauge("status_cache_entries", "Статусы в кэше")
+
+TELEGRAM_SEND_SECONDS = Histogram("telegram_send_duration_seconds", "Время запроса sendMessage")
+TELEGRAM_SENDS = Counter(
+    "telegram_send_total", "Отправки в Telegram по результату: sent, retry_after, failed, error", ("result",)
+)
+TELEGRAM_BACKLOG = Gauge("telegram_outbox_backlog", "Сообщения в очереди отправки процесса")
+
+BOT_HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Время обработки команды бота", ("handler",))
+BOT_HANDLER_ERRORS = Counter("bot_handler_errors_total", "Необработанные исключения в командах бота", ("handler",))
+# mode: polling (ChatOrderedUpdateProcessor) или webhook (UpdatePipeline)
+BOT_UPDATES_QUEUED = Gauge("bot_updates_queued", "Обновления бота, ждущие обработки", ("mode",))
+BOT_UPDATES_IN_PROGRESS = Gauge("bot_updates_in_progress", "Обновления бота в обработке", ("mode",))
+BOT_UPDATES_SHED = Counter("bot_updates_shed_total", "Обновления, отброшенные при переполнении очереди", ("mode",))
+BOT_UPDATE_WAIT_SECONDS = Histogram(
+    "bot_update_wait_seconds", "Ожидание обновления в очереди до начала обработки", ("mode",)
+)
+
+# --- Прослойка для API ---
+class MetricsMiddleware:
+    """ASGI-прослойка: время до начала ответа и коды по шаблонам маршрутов.
+
+    Для потоковых ответов (/status/stream) меряется время до первого байта.
+    profiler (SlowRequestProfiler) необязателен.
+    """
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_id = self.profiler.begin() if self.profiler is not None else None
+        responded = False
+
+        def record(status):
+            nonlocal responded
+            responded = True
+            # Шаблон маршрута, а не путь: /status/{telegram_id} — одна серия
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], path, str(status)).inc()
+            if request_id is not None:
+                self.profiler.end(request_id, f"{scope['method']} {path}")
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start" and not responded:
+                record(message["status"])
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            if not responded:
+                record(500)
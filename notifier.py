@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import os
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from metrics import TELEGRAM_BACKLOG, TELEGRAM_SEND_SECONDS, TELEGRAM_SENDS
+
+# --- Конфигурация ---
+# Адрес Bot API: для тестов можно указать локальный поддельный сервер
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # Сообщений в секунду на бота
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # Сообщений в секунду в один чат
+TELEGRAM_MAX_IN_FLIGHT = int(os.getenv("TELEGRAM_MAX_IN_FLIGHT", "30"))  # Одновременных запросов
+# Сколько сообщение может числиться отправляемым: дольше — процесс умер, сообщение снова в очереди
+SENDING_TIMEOUT_SECONDS = 120
+RETRY_MAX_DELAY_SECONDS = 300
+OUTBOX_RELOAD_SECONDS = 30  # Как часто перечитывать outbox: подхватить сообщения, потерянные из памяти
+OUTBOX_WRITE_RETRY_SECONDS = 1  # Первая пауза перед повтором записи в outbox (база занята)
+CHAT_BUCKETS_LIMIT = 10000  # Сколько вёдер по чатам держать до чистки
+
+# Приоритеты: чем меньше число, тем раньше отправка
+PRIORITY_ALARM = 0
+PRIORITY_NORMAL = 1
+
+class TokenBucket:
+    """Ведро токенов: rate сообщений в секунду, всплеск до capacity"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """Сколько секунд ждать до следующего токена"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def set_rate(self, rate):
+        # Всплеск не меньше одного сообщения, иначе токен не накопится никогда
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def block(self, now, seconds):
+        """Пауза после 429 от Telegram"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now):
+        return now >= self.blocked_until and self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+class NotificationDispatcher:
+    """Отправка уведомлений с соблюдением лимитов Telegram.
+
+    Каждое сообщение сначала сохраняется в outbox и помечается отправленным
+    только после ответа Telegram, поэтому переживает перезапуск. Очередь
+    приоритетная, скорость ограничена общим ведром и ведром на каждый чат,
+    ответ 429 (retry_after) приостанавливает всю отправку.
+
+    Сбой записи в outbox не теряет сообщение: оно возвращается в очередь
+    с паузой, а неотправленные строки outbox периодически перечитываются.
+    """
+
+    def __init__(self, storage, bot, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 max_in_flight=TELEGRAM_MAX_IN_FLIGHT, owns_bot=True):
+        self.storage = storage
+        self.bot = bot
+        self.global_rate = global_rate
+        self.lease_owner = None  # Задан — отправляются только сообщения из арендованных им разделов
+        # Чужой бот (общий с Application в COMBINED_MODE) открывает и закрывает его владелец
+        self.owns_bot = owns_bot
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets = {}
+        self.ready = []  # (priority, id, item) — можно отправлять
+        self.delayed = []  # (next_attempt_at, id, item) — ждут лимита или повтора
+        self.wakeup = asyncio.Event()
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.sending = set()
+        self.queued = set()  # id сообщений в памяти: в очереди или в отправке
+        self.buckets = None
+        self.task = None
+
+    def __len__(self):
+        return len(self.ready) + len(self.delayed) + len(self.sending)
+
+    def set_workers(self, workers):
+        """Общий лимит бота делится между живыми проверяющими процессами"""
+        self.global_bucket.set_rate(self.global_rate / max(workers, 1))
+
+    async def start(self, buckets=None):
+        """Поднять неотправленные сообщения из outbox и запустить отправку.
+
+        buckets — только тревоги по этим корзинам (разделы проверяющего процесса).
+        После stop() можно запустить заново с другим набором.
+        """
+        if self.owns_bot:
+            await self.bot.initialize()
+        await self.storage.prune_outbox()
+        self.ready, self.delayed, self.queued = [], [], set()
+        self.buckets = buckets
+        for item in await self.storage.pending_notifications(buckets):
+            self.push(item)
+        TELEGRAM_BACKLOG.set_function(self.__len__)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        # Уже отправляемые сообщения дожидаемся, остальные останутся в outbox
+        await asyncio.gather(*self.sending, return_exceptions=True)
+        if self.owns_bot:
+            await self.bot.shutdown()
+
+    def push(self, item):
+        self.queued.add(item["id"])
+        if item["next_attempt_at"] > time.time():
+            heapq.heappush(self.delayed, (item["next_attempt_at"], item["id"], item))
+        else:
+            heapq.heappush(self.ready, (item["priority"], item["id"], item))
+        self.wakeup.set()
+
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= CHAT_BUCKETS_LIMIT:
+                now = time.monotonic()
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items() if not value.is_idle(now)
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    async def reload(self):
+        """Неотправленные строки outbox, которых нет в памяти, снова в очередь"""
+        try:
+            items = await self.storage.pending_notifications(self.buckets)
+        except Exception as e:
+            print(f"❌ Ошибка чтения outbox: {e}")
+            return
+        for item in items:
+            if item["id"] not in self.queued:
+                self.push(item)
+
+    async def run(self):
+        reload_at = time.time() + OUTBOX_RELOAD_SECONDS
+        while True:
+            now = time.time()
+            if now >= reload_at:
+                await self.reload()
+                reload_at = now + OUTBOX_RELOAD_SECONDS
+            while self.delayed and self.delayed[0][0] <= now:
+                _, _, item = heapq.heappop(self.delayed)
+                heapq.heappush(self.ready, (item["priority"], item["id"], item))
+
+            if not self.ready:
+                timeout = min(self.delayed[0][0], reload_at) - now if self.delayed else reload_at - now
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self.global_bucket.wait_time(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, item = heapq.heappop(self.ready)
+            bucket = self.chat_bucket(item["chat_id"])
+            delay = bucket.wait_time(time.monotonic())
+            if delay > 0:
+                # Чат упёрся в свой лимит: откладываем, остальные чаты не ждут
+                heapq.heappush(self.delayed, (time.time() + delay, item["id"], item))
+                continue
+
+            self.global_bucket.take()
+            bucket.take()
+            await self.in_flight.acquire()
+            task = asyncio.create_task(self.send(item))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def send(self, item):
+        try:
+            await self.deliver(item)
+        finally:
+            self.in_flight.release()
+
+    async def deliver(self, item):
+        chat_id = item["chat_id"]
+        try:
+            # Раздел мог уйти другому процессу, пока сообщение ждало в памяти
+            claimed = await self.storage.claim_notification(
+                item["id"], time.time(), SENDING_TIMEOUT_SECONDS, self.lease_owner
+            )
+        except Exception as e:
+            # Строка не тронута: сообщение просто ждёт следующей попытки
+            print(f"❌ Ошибка записи в outbox для {chat_id}: {e}")
+            item["next_attempt_at"] = time.time() + OUTBOX_WRITE_RETRY_SECONDS
+            self.push(item)
+            return
+        if not claimed:
+            self.queued.discard(item["id"])
+            return
+
+        try:
+            with TELEGRAM_SEND_SECONDS.time():
+                await self.bot.send_message(chat_id=chat_id, text=item["text"])
+        except RetryAfter as e:
+            TELEGRAM_SENDS.labels("retry_after").inc()
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            print(f"⏳ Telegram просит подождать {retry_after} с перед отправкой в {chat_id}")
+            # 429 относится ко всему боту: ждут и остальные чаты
+            now = time.monotonic()
+            self.chat_bucket(chat_id).block(now, retry_after)
+            self.global_bucket.block(now, retry_after)
+            await self.retry(item, retry_after)
+        except (Forbidden, BadRequest) as e:
+            TELEGRAM_SENDS.labels("failed").inc()
+            # Бот заблокирован или чат не существует: повтор не поможет
+            print(f"❌ Сообщение для {chat_id} не может быть доставлено: {e}")
+            await self.finish(item, "failed")
+        except Exception as e:
+            TELEGRAM_SENDS.labels("error").inc()
+            print(f"❌ Ошибка отправки в Telegram {chat_id}: {e}")
+            await self.retry(item, min(RETRY_MAX_DELAY_SECONDS, 2 ** item["attempts"]))
+        else:
+            TELEGRAM_SENDS.labels("sent").inc()
+            print(f"✅ Сообщение отправлено {chat_id}: {item['text']}")
+            await self.finish(item, "sent")
+
+    async def retry(self, item, delay):
+        item["attempts"] += 1
+        try:
+            await self.storage.retry_notification(item["id"], item["attempts"], time.time() + delay)
+        except Exception as e:
+            # Строка осталась в sending: claim пройдёт только после SENDING_TIMEOUT_SECONDS
+            print(f"❌ Ошибка записи в outbox для {item['chat_id']}: {e}")
+            delay = max(delay, SENDING_TIMEOUT_SECONDS)
+        item["next_attempt_at"] = time.time() + delay
+        self.push(item)
+
+    async def finish(self, item, state):
+        """Записать итог отправки. Повторяем, пока строка числится за нами, иначе сообщение уйдёт ещё раз"""
+        give_up_at = time.monotonic() + SENDING_TIMEOUT_SECONDS
+        delay = OUTBOX_WRITE_RETRY_SECONDS
+        while True:
+            try:
+                await self.storage.finish_notification(item["id"], state)
+                break
+            except Exception as e:
+                if time.monotonic() + delay >= give_up_at:
+                    print(f"❌ Итог отправки {item['id']} не записан, сообщение может уйти повторно: {e}")
+                    break
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.queued.discard(item["id"])
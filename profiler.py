@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# --- Конфигурация ---
+# Порог медленного запроса; 0 — профилировщик выключен
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))  # Период снятия стека
+PROFILE_TOP_STACKS = 5  # Сколько самых частых стеков печатать
+PROFILE_STACK_DEPTH = 40
+
+def collapse_stack(frame):
+    """Стек в одну строку: внешний вызов слева, как во flame graph"""
+    names = []
+    while frame is not None and len(names) < PROFILE_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SlowRequestProfiler:
+    """Сэмплирующий профилировщик медленных запросов.
+
+    Фоновый поток снимает стек потока цикла событий, только пока есть запрос
+    дольше порога, поэтому быстрые запросы ничего не стоят. Цикл событий один
+    на все запросы: стек показывает, чем занят процесс, пока запрос медленный
+    (select в вершине значит ожидание ввода-вывода, а не работу на CPU).
+    """
+
+    def __init__(self, threshold_ms=PROFILE_SLOW_REQUESTS_MS, interval_ms=PROFILE_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.in_flight = {}  # номер запроса -> [начало, Counter стеков или None]
+        self.next_id = 0
+        self.thread_id = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Запуск из потока цикла событий: его стек и будет сниматься"""
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="slow-request-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def begin(self):
+        self.next_id += 1
+        self.in_flight[self.next_id] = [time.perf_counter(), None]
+        return self.next_id
+
+    def end(self, request_id, name):
+        started, samples = self.in_flight.pop(request_id)
+        elapsed = time.perf_counter() - started
+        if samples and elapsed >= self.threshold:
+            self.report(name, elapsed, samples)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            slow = [entry for entry in tuple(self.in_flight.values()) if now - entry[0] >= self.threshold]
+            if not slow:
+                continue
+
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = collapse_stack(frame)
+            for entry in slow:
+                if entry[1] is None:
+                    entry[1] = Counter()
+                entry[1][stack] += 1
+
+    def report(self, name, elapsed, samples):
+        total = sum(samples.values())
+        print(f"🐢 Медленный запрос {name}: {elapsed * 1000:.0f} мс, сэмплов: {total}")
+        for stack, count in samples.most_common(PROFILE_TOP_STACKS):
+            print(f"   {count / total:.0%} {stack}")
+
+def create_profiler():
+    """Профилировщик, если задан PROFILE_SLOW_REQUESTS_MS, иначе None"""
+    if PROFILE_SLOW_REQUESTS_MS <= 0:
+        return None
+    return SlowRequestProfiler()
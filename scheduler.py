@@ -0,0 +1,103 @@
+import asyncio
+import heapq
+import math
+import os
+import time
+
+# --- Конфигурация ---
+# Сколько секунд вперёд держать дедлайны в памяти. Должно быть меньше 24 часов:
+# любая новая отметка или регистрация даёт дедлайн дальше окна и подгрузится из базы позже
+SCHEDULER_HORIZON_SECONDS = int(os.getenv("SCHEDULER_HORIZON_SECONDS", "3600"))
+
+class DeadlineScheduler:
+    """Планировщик тревог по дедлайнам.
+
+    Ближайшие дедлайны (окно horizon) лежат в min-heap, дальние остаются в базе
+    под индексом deadline и подгружаются окнами. Между дедлайнами цикл спит.
+    """
+
+    def __init__(self, load_window, horizon=SCHEDULER_HORIZON_SECONDS):
+        # load_window(after, until) -> асинхронный итератор (telegram_id, deadline) с дедлайном в (after, until].
+        # None: дедлайны ставятся только через schedule(), окно не ограничено
+        self.load_window = load_window
+        self.horizon = horizon
+        self.heap = []
+        self.deadlines = {}  # telegram_id -> актуальный дедлайн; прочие записи в куче устарели
+        self.loaded_until = None
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, telegram_id, deadline):
+        """Поставить (или перенести) дедлайн пользователя"""
+        if deadline is None or (self.loaded_until is not None and deadline > self.loaded_until):
+            # Дедлайн за пределами окна: его подгрузит следующее окно
+            self.deadlines.pop(telegram_id, None)
+            return
+
+        self.deadlines[telegram_id] = deadline
+        heapq.heappush(self.heap, (deadline, telegram_id))
+        if self.heap[0] == (deadline, telegram_id):
+            self.wakeup.set()
+
+    def cancel(self, telegram_id):
+        """Снять пользователя с расписания (запись в куче станет устаревшей)"""
+        self.deadlines.pop(telegram_id, None)
+
+    async def load_next_window(self, now):
+        """Подгрузить из базы дедлайны до now + horizon"""
+        if self.load_window is None:
+            self.loaded_until = math.inf
+            return
+
+        after = self.loaded_until
+        until = now + self.horizon
+        # Граница сдвигается заранее, иначе schedule() отбросит дедлайны нового окна
+        self.loaded_until = until
+        try:
+            async for telegram_id, deadline in self.load_window(after, until):
+                self.schedule(telegram_id, deadline)
+        except BaseException:
+            # Окно прочитано не целиком: следующая попытка перечитает его с начала
+            self.loaded_until = after
+            raise
+
+    def pop_due(self, now):
+        """Извлечь всех пользователей, чей дедлайн наступил"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, telegram_id = heapq.heappop(self.heap)
+            if self.deadlines.get(telegram_id) != deadline:
+                continue
+            del self.deadlines[telegram_id]
+            due.append((telegram_id, deadline))
+        return due
+
+    def next_wakeup(self):
+        """Когда проснуться: ближайший дедлайн или пора подгружать следующее окно"""
+        refill_at = self.loaded_until - self.horizon / 2
+        earliest = self.heap[0][0] if self.heap else math.inf
+        return min(earliest, refill_at)
+
+    async def run(self, on_due):
+        """Основной цикл: спим до ближайшего дедлайна, затем вызываем on_due(due)"""
+        await self.load_next_window(time.time())
+
+        while True:
+            now = time.time()
+            if now >= self.loaded_until - self.horizon / 2:
+                await self.load_next_window(now)
+
+            due = self.pop_due(now)
+            if due:
+                await on_due(due)
+                continue
+
+            self.wakeup.clear()
+            delay = self.next_wakeup() - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
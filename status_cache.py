@@ -0,0 +1,125 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from storage import compute_deadline
+
+# --- Конфигурация ---
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "10000"))  # Сколько статусов держать в памяти
+STATUS_CACHE_TTL_SECONDS = float(os.getenv("STATUS_CACHE_TTL_SECONDS", "60"))
+
+# --- Вычисление статуса ---
+def build_status_entry(user, now):
+    """Статус пользователя с заголовками для условных запросов и сроком годности"""
+    last_checkin = user["checkin_time"]
+    deadline = user["deadline"]
+    if deadline is None:
+        deadline = compute_deadline(last_checkin)
+
+    status = "ALARM" if deadline is not None and now > deadline else "OK"
+    body = {
+        "status": status,
+        "last_checkin": last_checkin,
+        "contact_telegram_id": user["contact_telegram_id"]
+    }
+
+    # Только ETag: контакт меняется без новой отметки (загрузка с update), и дата
+    # отметки как Last-Modified отдала бы 304 со старым контактом
+    etag = hashlib.blake2b(
+        f"{user['telegram_id']}|{last_checkin}|{status}|{user['contact_telegram_id']}".encode(),
+        digest_size=8
+    ).hexdigest()
+
+    return {
+        "body": body,
+        "headers": {
+            "ETag": f'"{etag}"',
+            "Cache-Control": "no-cache"
+        },
+        # Статус OK сам сменится на ALARM в момент дедлайна
+        "flips_at": deadline if status == "OK" else None
+    }
+
+def is_not_modified(headers, entry):
+    """Проверка If-None-Match: можно ответить 304"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in etags or entry["headers"]["ETag"] in etags
+
+# --- Кэш ---
+class StatusCache:
+    """Ограниченный LRU-кэш вычисленных статусов с TTL.
+
+    Отметка и регистрация сбрасывают запись. Чтение, начатое до сброса,
+    не может положить в кэш устаревший статус.
+    """
+
+    def __init__(self, max_size=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # telegram_id -> (expires_at, entry)
+        self.invalidations = OrderedDict()  # telegram_id -> номер последнего сброса
+        self.seq = 0
+        self.cleared_seq = 0  # Чтения, начатые до clear(), в кэш не попадают
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, telegram_id, now):
+        cached = self.entries.get(telegram_id)
+        if cached is None or cached[0] <= now:
+            if cached is not None:
+                del self.entries[telegram_id]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(telegram_id)
+        self.hits += 1
+        return cached[1]
+
+    def read_token(self):
+        """Отметка перед чтением из базы: передаётся в put()"""
+        return self.seq
+
+    def put(self, telegram_id, entry, now, token):
+        if self.cleared_seq > token or self.invalidations.get(telegram_id, 0) > token:
+            # Пока читали базу, пользователь отметился
+            return
+
+        expires_at = now + self.ttl
+        if entry["flips_at"] is not None:
+            expires_at = min(expires_at, entry["flips_at"])
+
+        self.entries[telegram_id] = (expires_at, entry)
+        self.entries.move_to_end(telegram_id)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, telegram_id):
+        self.seq += 1
+        self.entries.pop(telegram_id, None)
+        self.invalidations[telegram_id] = self.seq
+        self.invalidations.move_to_end(telegram_id)
+        if len(self.invalidations) > self.max_size:
+            self.invalidations.popitem(last=False)
+
+    def clear(self):
+        """Сбросить всё (массовая загрузка пользователей)"""
+        self.seq += 1
+        self.cleared_seq = self.seq
+        self.entries.clear()
+        self.invalidations.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
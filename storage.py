@@ -0,0 +1,787 @@
+import asyncio
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from metrics import DB_CHECKIN_BATCH_SIZE, DB_CONNECTIONS_OPENED, DB_QUERY_SECONDS, DB_WAIT_SECONDS
+
+# --- Конфигурация ---
+DB_PATH = os.getenv("DB_PATH", "users.db")
+ALARM_TIMEOUT = timedelta(hours=24)  # Сколько можно не отмечаться до тревоги
+DUE_PAGE_SIZE = 1000  # Сколько просроченных пользователей читать за один запрос
+DB_READERS = int(os.getenv("DB_READERS", "4"))  # Размер пула соединений на чтение
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "FULL")  # FULL: отметка переживает сбой питания
+DB_BUSY_TIMEOUT_MS = 5000
+SCHEMA_LOCK_TIMEOUT_SECONDS = 300  # Сколько ждать миграции, начатой другим процессом
+DB_CACHED_STATEMENTS = 256  # Кэш подготовленных выражений на соединение
+# Групповая запись отметок (write-behind): включается CHECKIN_BATCHING=1
+CHECKIN_BATCHING = os.getenv("CHECKIN_BATCHING", "0") == "1"
+CHECKIN_FLUSH_MS = int(os.getenv("CHECKIN_FLUSH_MS", "5"))  # Сколько копить пачку
+CHECKIN_BATCH_SIZE = int(os.getenv("CHECKIN_BATCH_SIZE", "1000"))  # Сброс раньше срока, если набралось
+EXPORT_FETCH_SIZE = 5000  # Строк за одно чтение курсора при выгрузке
+# Пользователи разложены по корзинам хэша telegram_id; разделы проверяющих — диапазоны корзин
+HASH_BUCKETS = 256
+
+# --- Схема ---
+def compute_deadline(checkin_time):
+    """Момент (unix time), после которого пользователь считается в ALARM"""
+    if not checkin_time:
+        return None
+    return (datetime.fromisoformat(str(checkin_time)) + ALARM_TIMEOUT).timestamp()
+
+def hash_bucket(telegram_id):
+    """Корзина пользователя: не зависит от числа разделов и процессов"""
+    return zlib.crc32(str(telegram_id).encode()) % HASH_BUCKETS
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Создание таблиц и миграция колонок deadline, alarm_sent_at, change_seq и hash_bucket с индексами.
+
+    API и проверяющие процессы стартуют одновременно: миграция идёт под
+    блокировкой записи (BEGIN IMMEDIATE), и колонки проверяются уже под ней,
+    поэтому второй процесс ждёт первого и не добавляет колонку повторно.
+    """
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrate_schema(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def migrate_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            contact_telegram_id TEXT,
+            checkin_time TEXT DEFAULT CURRENT_TIMESTAMP,
+            deadline REAL,
+            alarm_sent_at REAL,
+            change_seq INTEGER,
+            hash_bucket INTEGER
+        )
+    """)
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if "deadline" not in columns:
+        # Старая база: добавляем колонку и заполняем её из checkin_time
+        conn.execute("ALTER TABLE users ADD COLUMN deadline REAL")
+        rows = conn.execute("SELECT id, checkin_time FROM users").fetchall()
+        conn.executemany(
+            "UPDATE users SET deadline = ? WHERE id = ?",
+            [(compute_deadline(checkin_time), user_id) for user_id, checkin_time in rows]
+        )
+        columns.append("deadline")
+
+    if "alarm_sent_at" not in columns:
+        # Журнал тревог: когда контакту ушла тревога по текущему дедлайну
+        conn.execute("ALTER TABLE users ADD COLUMN alarm_sent_at REAL")
+
+    if "change_seq" not in columns:
+        # Лента изменений: номер последней записи (регистрации или отметки)
+        conn.execute("ALTER TABLE users ADD COLUMN change_seq INTEGER")
+        conn.execute("UPDATE users SET change_seq = id")
+
+    if "hash_bucket" not in columns:
+        # Разбиение пользователей между проверяющими процессами
+        conn.execute("ALTER TABLE users ADD COLUMN hash_bucket INTEGER")
+        rows = conn.execute("SELECT id, telegram_id FROM users").fetchall()
+        conn.executemany(
+            "UPDATE users SET hash_bucket = ? WHERE id = ?",
+            [(hash_bucket(telegram_id), user_id) for user_id, telegram_id in rows]
+        )
+
+    # Индекс по дедлайну без уже поднятых тревог: выборка читает только тех, кого ещё надо проверить
+    conn.execute("DROP INDEX IF EXISTS ix_users_deadline")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_users_pending_deadline ON users (deadline) WHERE alarm_sent_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_users_change_seq ON users (change_seq)")
+    # То же для одного раздела: hash_bucket IN (...) раскрывается в поиск по каждой корзине
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_users_pending_bucket ON users (hash_bucket, deadline, id) "
+        "WHERE alarm_sent_at IS NULL"
+    )
+
+    # Водяной знак ленты больше не хранится: каждый запуск начинает с last_change_seq()
+    conn.execute("DROP TABLE IF EXISTS checker_state")
+
+    # Очередь исходящих сообщений: неотправленные тревоги переживают перезапуск
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 1,
+            dedupe_key TEXT UNIQUE,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL,
+            finished_at REAL,
+            hash_bucket INTEGER
+        )
+    """)
+    if "hash_bucket" not in [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]:
+        # Корзина пользователя, по которому тревога: отправляет владелец раздела
+        conn.execute("ALTER TABLE outbox ADD COLUMN hash_bucket INTEGER")
+        # Сообщения от старой версии неотправленными не остаются: их берёт раздел с корзиной 0
+        conn.execute("UPDATE outbox SET hash_bucket = 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_pending ON outbox (id) WHERE state = 'pending'")
+
+    # Аренда разделов проверяющими процессами: раздел — диапазон корзин [bucket_lo, bucket_hi]
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS checker_leases (
+            partition INTEGER PRIMARY KEY,
+            bucket_lo INTEGER NOT NULL,
+            bucket_hi INTEGER NOT NULL,
+            owner TEXT,
+            expires_at REAL NOT NULL DEFAULT 0
+        )
+    """)
+    # Живые проверяющие процессы: по их числу делятся разделы
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS checker_workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat_at REAL NOT NULL
+        )
+    """)
+
+# --- Строки таблиц ---
+USER_COLUMNS = "id, telegram_id, name, contact_telegram_id, checkin_time, deadline, alarm_sent_at, hash_bucket"
+# Следующий номер в ленте изменений: запись в SQLite одна за раз, поэтому номера растут по порядку commit
+NEXT_CHANGE_SEQ = "(SELECT COALESCE(MAX(change_seq), 0) + 1 FROM users)"
+MAX_ROWID = 2 ** 63 - 1
+LOOKUP_CHUNK_SIZE = 500  # Ограничение на число параметров в одном IN (...)
+
+def row_to_user(row):
+    return {
+        "id": row[0],
+        "telegram_id": row[1],
+        "name": row[2],
+        "contact_telegram_id": row[3],
+        "checkin_time": row[4],
+        "deadline": row[5],
+        "alarm_sent_at": row[6],
+        "hash_bucket": row[7]
+    }
+
+OUTBOX_COLUMNS = "id, chat_id, text, priority, attempts, next_attempt_at"
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 3600  # Сколько хранить отправленные сообщения
+
+def row_to_notification(row):
+    return {
+        "id": row[0],
+        "chat_id": row[1],
+        "text": row[2],
+        "priority": row[3],
+        "attempts": row[4],
+        "next_attempt_at": row[5]
+    }
+
+async def insert_notification(conn, chat_id, text, priority, dedupe_key, bucket):
+    """Вставка в outbox внутри уже открытой транзакции. bucket — корзина пользователя тревоги"""
+    now = time.time()
+    cursor = await conn.execute("""
+        INSERT OR IGNORE INTO outbox (chat_id, text, priority, dedupe_key, created_at, next_attempt_at, hash_bucket)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (str(chat_id), text, priority, dedupe_key, now, now, bucket))
+    if cursor.rowcount == 0:
+        return None
+
+    return {
+        "id": cursor.lastrowid,
+        "chat_id": str(chat_id),
+        "text": text,
+        "priority": priority,
+        "attempts": 0,
+        "next_attempt_at": now
+    }
+
+async def update_checkins(conn, checkins):
+    """Отметки (telegram_id, checkin_time) внутри открытой транзакции"""
+    # executemany: у каждой строки свой номер в ленте изменений
+    await conn.executemany(
+        f"""
+            UPDATE users
+            SET checkin_time = ?, deadline = ?, alarm_sent_at = NULL, change_seq = {NEXT_CHANGE_SEQ}
+            WHERE telegram_id = ?
+        """,
+        [
+            (checkin_time, compute_deadline(checkin_time), telegram_id)
+            for telegram_id, checkin_time in checkins
+        ]
+    )
+
+async def insert_users(conn, users, checkin_time):
+    """Вставка (telegram_id, name, contact_telegram_id) внутри открытой транзакции"""
+    deadline = compute_deadline(checkin_time)
+    await conn.executemany(
+        f"""
+            INSERT INTO users (telegram_id, name, contact_telegram_id, checkin_time, deadline, hash_bucket, change_seq)
+            VALUES (?, ?, ?, ?, ?, ?, {NEXT_CHANGE_SEQ})
+        """,
+        [
+            (telegram_id, name, contact_telegram_id, checkin_time, deadline, hash_bucket(telegram_id))
+            for telegram_id, name, contact_telegram_id in users
+        ]
+    )
+
+async def select_existing(conn, telegram_ids):
+    """Какие из telegram_id уже есть в базе"""
+    existing = set()
+    telegram_ids = list(telegram_ids)
+    for i in range(0, len(telegram_ids), LOOKUP_CHUNK_SIZE):
+        chunk = telegram_ids[i:i + LOOKUP_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        async with conn.execute(
+            f"SELECT telegram_id FROM users WHERE telegram_id IN ({placeholders})", chunk
+        ) as cursor:
+            existing.update(row[0] for row in await cursor.fetchall())
+    return existing
+
+# --- Групповая запись отметок ---
+class CheckinBatcher:
+    """Копит отметки в памяти и пишет их одной транзакцией.
+
+    Повторные отметки одного telegram_id склеиваются (побеждает последняя).
+    Запрос получает ответ только после commit своей пачки.
+    """
+
+    def __init__(self, storage, flush_interval=CHECKIN_FLUSH_MS / 1000, max_batch=CHECKIN_BATCH_SIZE):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = {}  # telegram_id -> checkin_time
+        self.waiters = []
+        self.has_pending = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        self.stopping = False
+        self.task = None
+
+    def start(self):
+        self.stopping = False
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # Без cancel(): начатая запись пачки должна дойти до commit и ответить своим запросам
+        if self.task is not None:
+            self.stopping = True
+            self.has_pending.set()
+            self.batch_full.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+    async def update_checkin_time(self, telegram_id: str, checkin_time: str):
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending[telegram_id] = checkin_time
+        self.waiters.append(waiter)
+        self.has_pending.set()
+        if len(self.pending) >= self.max_batch:
+            self.batch_full.set()
+        await waiter
+
+    async def run(self):
+        while not self.stopping:
+            await self.has_pending.wait()
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Записать накопленную пачку и разбудить ждущие запросы"""
+        batch, waiters = self.pending, self.waiters
+        self.pending, self.waiters = {}, []
+        self.has_pending.clear()
+        self.batch_full.clear()
+        if not batch:
+            return
+
+        DB_CHECKIN_BATCH_SIZE.observe(len(batch))
+        try:
+            await self.storage.write_checkins(batch.items())
+        except asyncio.CancelledError:
+            # Транзакция откатилась: запросы пачки не должны ждать вечно
+            for waiter in waiters:
+                waiter.cancel()
+            raise
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+# --- Асинхронный слой хранения ---
+class Storage:
+    """Долгоживущие соединения к базе: WAL, пул читателей и один писатель.
+
+    Запросы выполняются в потоках aiosqlite, поэтому не блокируют цикл событий.
+    """
+
+    def __init__(self, path=DB_PATH, readers=DB_READERS, batch_checkins=CHECKIN_BATCHING):
+        self.path = path
+        self.readers_count = readers
+        self.readers = None
+        self.writer = None
+        self.write_lock = asyncio.Lock()
+        self.batcher = CheckinBatcher(self) if batch_checkins else None
+
+    async def connect(self, read_only=False):
+        conn = await aiosqlite.connect(self.path, cached_statements=DB_CACHED_STATEMENTS)
+        await conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        await conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        if read_only:
+            await conn.execute("PRAGMA query_only = ON")
+        DB_CONNECTIONS_OPENED.labels("read" if read_only else "write").inc()
+        return conn
+
+    async def open(self):
+        """Создание схемы, включение WAL и открытие соединений"""
+        def init_schema():
+            conn = sqlite3.connect(self.path, timeout=SCHEMA_LOCK_TIMEOUT_SECONDS)
+            ensure_schema(conn)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.close()
+
+        await asyncio.to_thread(init_schema)
+
+        self.writer = await self.connect()
+        self.readers = asyncio.Queue()
+        for _ in range(self.readers_count):
+            self.readers.put_nowait(await self.connect(read_only=True))
+
+        if self.batcher is not None:
+            self.batcher.start()
+
+    async def close(self):
+        if self.batcher is not None:
+            await self.batcher.stop()
+        if self.readers is not None:
+            while not self.readers.empty():
+                await self.readers.get_nowait().close()
+            self.readers = None
+        if self.writer is not None:
+            await self.writer.close()
+            self.writer = None
+
+    @asynccontextmanager
+    async def reader(self, op="read"):
+        """Соединение на чтение из пула. op — имя операции в метриках"""
+        started = time.perf_counter()
+        conn = await self.readers.get()
+        acquired = time.perf_counter()
+        DB_WAIT_SECONDS.labels("read").observe(acquired - started)
+        try:
+            yield conn
+        finally:
+            self.readers.put_nowait(conn)
+            DB_QUERY_SECONDS.labels(op).observe(time.perf_counter() - acquired)
+
+    @asynccontextmanager
+    async def transaction(self, op="write"):
+        """Единственный писатель: транзакция под блокировкой, commit или rollback"""
+        started = time.perf_counter()
+        async with self.write_lock:
+            acquired = time.perf_counter()
+            DB_WAIT_SECONDS.labels("write").observe(acquired - started)
+            try:
+                yield self.writer
+                await self.writer.commit()
+            except BaseException:
+                await self.writer.rollback()
+                raise
+            finally:
+                DB_QUERY_SECONDS.labels(op).observe(time.perf_counter() - acquired)
+
+    # --- Пользователи ---
+    async def get_user_by_telegram_id(self, telegram_id: str):
+        async with self.reader("get_user_by_telegram_id") as conn:
+            async with conn.execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?", (telegram_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row_to_user(row) if row else None
+
+    async def update_checkin_time(self, telegram_id: str):
+        checkin_time = datetime.now().isoformat()
+        if self.batcher is not None:
+            await self.batcher.update_checkin_time(telegram_id, checkin_time)
+        else:
+            await self.write_checkins([(telegram_id, checkin_time)])
+
+    async def write_checkins(self, checkins):
+        """Записать пары (telegram_id, checkin_time) одной транзакцией"""
+        async with self.transaction("write_checkins") as conn:
+            await update_checkins(conn, checkins)
+
+    async def register_user(self, telegram_id: str, name: str, contact_telegram_id: str):
+        checkin_time = datetime.now().isoformat()
+        try:
+            async with self.transaction("register_user") as conn:
+                await insert_users(conn, [(telegram_id, name, contact_telegram_id)], checkin_time)
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    # --- Пакетные операции ---
+    async def checkin_users(self, telegram_ids):
+        """Отметка списка пользователей одной транзакцией. Возвращает найденные telegram_id"""
+        checkin_time = datetime.now().isoformat()
+        async with self.transaction("checkin_users") as conn:
+            existing = await select_existing(conn, set(telegram_ids))
+            await update_checkins(conn, [(telegram_id, checkin_time) for telegram_id in existing])
+        return existing
+
+    async def register_users(self, users):
+        """Регистрация списка (telegram_id, name, contact_telegram_id) одной транзакцией.
+
+        Возвращает telegram_id, которые были зарегистрированы; при повторах в списке побеждает первый.
+        """
+        checkin_time = datetime.now().isoformat()
+        new_users = {}
+        for telegram_id, name, contact_telegram_id in users:
+            new_users.setdefault(telegram_id, (telegram_id, name, contact_telegram_id))
+
+        async with self.transaction("register_users") as conn:
+            existing = await select_existing(conn, new_users.keys())
+            registered = [user for telegram_id, user in new_users.items() if telegram_id not in existing]
+            await insert_users(conn, registered, checkin_time)
+        return {user[0] for user in registered}
+
+    # --- Массовая загрузка и выгрузка ---
+    async def import_users(self, users, update_existing=False):
+        """Запись пачки (telegram_id, name, contact_telegram_id, checkin_time, alarm_sent_at) одной транзакцией.
+
+        Новые пользователи добавляются, существующие пропускаются или, с
+        update_existing, получают имя и контакт из файла; отметка берётся более
+        поздняя из двух, чтобы загрузка не отменила настоящую отметку.
+        Возвращает число записанных строк.
+        """
+        on_conflict = "DO NOTHING"
+        if update_existing:
+            # В SET справа — старые значения строки, excluded — из файла.
+            # Отметка, дедлайн и журнал тревог берутся из одной строки по одному условию:
+            # checkin_time в базе и в файле бывают в разных форматах, сравнивать их строками нельзя
+            newer = "deadline IS NULL OR excluded.deadline > deadline"
+            on_conflict = f"""
+                DO UPDATE SET
+                    name = excluded.name,
+                    contact_telegram_id = excluded.contact_telegram_id,
+                    checkin_time = CASE WHEN {newer} THEN excluded.checkin_time ELSE checkin_time END,
+                    deadline = CASE WHEN {newer} THEN excluded.deadline ELSE deadline END,
+                    alarm_sent_at = CASE WHEN {newer} THEN excluded.alarm_sent_at ELSE alarm_sent_at END,
+                    change_seq = excluded.change_seq
+            """
+
+        async with self.transaction("import_users") as conn:
+            before = conn.total_changes
+            await conn.executemany(
+                f"""
+                    INSERT INTO users (
+                        telegram_id, name, contact_telegram_id, checkin_time, deadline, alarm_sent_at, hash_bucket, change_seq
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, {NEXT_CHANGE_SEQ})
+                    ON CONFLICT (telegram_id) {on_conflict}
+                """,
+                [
+                    (telegram_id, name, contact_telegram_id, checkin_time,
+                     compute_deadline(checkin_time), alarm_sent_at, hash_bucket(telegram_id))
+                    for telegram_id, name, contact_telegram_id, checkin_time, alarm_sent_at in users
+                ]
+            )
+            return conn.total_changes - before
+
+    async def export_users(self, fetch_size=EXPORT_FETCH_SIZE):
+        """Все пользователи порциями, курсором по отдельному соединению.
+
+        Пул читателей не занимается, сколько бы ни длилась выгрузка; WAL
+        даёт снимок на начало чтения, запись в это время не блокируется.
+        """
+        conn = await self.connect(read_only=True)
+        try:
+            async with conn.execute(
+                "SELECT telegram_id, name, contact_telegram_id, checkin_time, deadline, alarm_sent_at "
+                "FROM users ORDER BY id"
+            ) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(fetch_size)
+                    if not rows:
+                        return
+                    yield rows
+        finally:
+            await conn.close()
+
+    # --- Выборка по дедлайнам ---
+    async def iter_users_by_deadline(self, until, after=None, page_size=DUE_PAGE_SIZE, buckets=None):
+        """Постраничный обход пользователей без поднятой тревоги с дедлайном в (after, until].
+
+        buckets — только эти корзины hash_bucket (разделы проверяющего), None — все.
+        С buckets порядок по дедлайну соблюдается только внутри корзины.
+        """
+        if buckets is None:
+            async for page in self.iter_pending_deadlines(until, after, page_size, "", ()):
+                yield page
+            return
+
+        # hash_bucket IN (...) не даёт индексу порядка (deadline, id): каждая страница сортировала бы
+        # остаток окна заново. Корзины обходятся по одной и склеиваются в страницы page_size
+        page = []
+        for bucket in sorted(buckets):
+            async for rows in self.iter_pending_deadlines(until, after, page_size, "AND hash_bucket = ?", (bucket,)):
+                page.extend(rows)
+                while len(page) >= page_size:
+                    yield page[:page_size]
+                    page = page[page_size:]
+        if page:
+            yield page
+
+    async def iter_pending_deadlines(self, until, after, page_size, bucket_filter, bucket_params):
+        # (deadline, id) > (after, MAX_ROWID) эквивалентно deadline > after
+        last_deadline = after if after is not None else float("-inf")
+        last_id = MAX_ROWID
+
+        while True:
+            async with self.reader("iter_users_by_deadline") as conn:
+                async with conn.execute(f"""
+                    SELECT {USER_COLUMNS}
+                    FROM users
+                    WHERE alarm_sent_at IS NULL AND deadline <= ? AND (deadline, id) > (?, ?) {bucket_filter}
+                    ORDER BY deadline, id
+                    LIMIT ?
+                """, (until, last_deadline, last_id, *bucket_params, page_size)) as cursor:
+                    rows = await cursor.fetchall()
+
+            if not rows:
+                return
+
+            yield [row_to_user(row) for row in rows]
+
+            if len(rows) < page_size:
+                return
+            last_deadline, last_id = rows[-1][5], rows[-1][0]
+
+    async def get_users_by_telegram_ids(self, telegram_ids):
+        """Пакетное чтение пользователей по списку telegram_id"""
+        users = []
+        telegram_ids = list(telegram_ids)
+        async with self.reader("get_users_by_telegram_ids") as conn:
+            for i in range(0, len(telegram_ids), LOOKUP_CHUNK_SIZE):
+                chunk = telegram_ids[i:i + LOOKUP_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                async with conn.execute(
+                    f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id IN ({placeholders})", chunk
+                ) as cursor:
+                    users.extend(row_to_user(row) for row in await cursor.fetchall())
+        return users
+
+    # --- Журнал тревог и лента изменений ---
+    async def claim_alarms(self, telegram_ids, now, build_notification, lease_owner=None):
+        """Отметить тревогу в журнале и поставить уведомление в outbox одной транзакцией.
+
+        Берутся только пользователи, у которых дедлайн всё ещё истёк и тревоги
+        ещё не было. build_notification(user) -> (chat_id, text, priority, dedupe_key) или None.
+        С lease_owner — только из разделов, которые он арендует на момент записи:
+        проверка и запись идут под блокировкой писателя, второй процесс их не перехватит.
+        Возвращает (число поднятых тревог, новые записи outbox).
+        """
+        claimed = 0
+        notifications = []
+        telegram_ids = list(telegram_ids)
+        lease_filter, lease_params = "", ()
+        if lease_owner is not None:
+            lease_filter = """
+                AND EXISTS (
+                    SELECT 1 FROM checker_leases
+                    WHERE owner = ? AND expires_at > ? AND users.hash_bucket BETWEEN bucket_lo AND bucket_hi
+                )
+            """
+            lease_params = (lease_owner, now)
+
+        async with self.transaction("claim_alarms") as conn:
+            for i in range(0, len(telegram_ids), LOOKUP_CHUNK_SIZE):
+                chunk = telegram_ids[i:i + LOOKUP_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                async with conn.execute(f"""
+                    UPDATE users SET alarm_sent_at = ?
+                    WHERE telegram_id IN ({placeholders}) AND alarm_sent_at IS NULL AND deadline <= ? {lease_filter}
+                    RETURNING {USER_COLUMNS}
+                """, (now, *chunk, now, *lease_params)) as cursor:
+                    users = [row_to_user(row) for row in await cursor.fetchall()]
+
+                claimed += len(users)
+                for user in users:
+                    notification = build_notification(user)
+                    if notification is None:
+                        continue
+                    item = await insert_notification(conn, *notification, bucket=user["hash_bucket"])
+                    if item is not None:
+                        notifications.append(item)
+
+        return claimed, notifications
+
+    async def last_change_seq(self):
+        async with self.reader("last_change_seq") as conn:
+            async with conn.execute("SELECT COALESCE(MAX(change_seq), 0) FROM users") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def changes_since(self, change_seq, limit=DUE_PAGE_SIZE):
+        """Пользователи, записанные после водяного знака:
+        (telegram_id, deadline, alarm_sent_at, change_seq, hash_bucket)
+        """
+        async with self.reader("changes_since") as conn:
+            async with conn.execute("""
+                SELECT telegram_id, deadline, alarm_sent_at, change_seq, hash_bucket
+                FROM users
+                WHERE change_seq > ?
+                ORDER BY change_seq
+                LIMIT ?
+            """, (change_seq, limit)) as cursor:
+                return await cursor.fetchall()
+
+    # --- Аренда разделов проверяющими ---
+    async def ensure_partitions(self, ranges, now):
+        """Завести разделы [(partition, bucket_lo, bucket_hi)].
+
+        Другое разбиение можно применить, только когда ни одна аренда не действует.
+        """
+        async with self.transaction("ensure_partitions") as conn:
+            async with conn.execute(
+                "SELECT partition, bucket_lo, bucket_hi, expires_at FROM checker_leases ORDER BY partition"
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+            if [tuple(row[:3]) for row in rows] == list(ranges):
+                return
+            if any(row[3] > now for row in rows):
+                raise ValueError(
+                    "Разбиение на разделы отличается от того, что используют работающие проверяющие процессы"
+                )
+
+            await conn.execute("DELETE FROM checker_leases")
+            await conn.executemany(
+                "INSERT INTO checker_leases (partition, bucket_lo, bucket_hi) VALUES (?, ?, ?)", ranges
+            )
+
+    async def heartbeat_worker(self, worker_id, now, ttl):
+        """Отметить процесс живым, забыть молчащих дольше ttl. Возвращает число живых"""
+        async with self.transaction("heartbeat_worker") as conn:
+            await conn.execute(
+                "INSERT INTO checker_workers (worker_id, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (worker_id, now)
+            )
+            await conn.execute("DELETE FROM checker_workers WHERE heartbeat_at <= ?", (now - ttl,))
+            async with conn.execute("SELECT COUNT(*) FROM checker_workers") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def remove_worker(self, worker_id):
+        """Корректная остановка: отдать аренды сразу, не дожидаясь их истечения"""
+        async with self.transaction("remove_worker") as conn:
+            await conn.execute("UPDATE checker_leases SET owner = NULL, expires_at = 0 WHERE owner = ?", (worker_id,))
+            await conn.execute("DELETE FROM checker_workers WHERE worker_id = ?", (worker_id,))
+
+    async def renew_leases(self, owner, now, expires_at):
+        """Продлить ещё действующие аренды владельца. Возвращает [(partition, bucket_lo, bucket_hi)]"""
+        async with self.transaction("renew_leases") as conn:
+            async with conn.execute("""
+                UPDATE checker_leases SET expires_at = ?
+                WHERE owner = ? AND expires_at > ?
+                RETURNING partition, bucket_lo, bucket_hi
+            """, (expires_at, owner, now)) as cursor:
+                return sorted(tuple(row) for row in await cursor.fetchall())
+
+    async def acquire_leases(self, owner, now, expires_at, limit):
+        """Взять до limit свободных или просроченных разделов"""
+        async with self.transaction("acquire_leases") as conn:
+            async with conn.execute("""
+                UPDATE checker_leases SET owner = ?, expires_at = ?
+                WHERE partition IN (
+                    SELECT partition FROM checker_leases
+                    WHERE owner IS NULL OR expires_at <= ?
+                    ORDER BY partition
+                    LIMIT ?
+                )
+                RETURNING partition, bucket_lo, bucket_hi
+            """, (owner, expires_at, now, limit)) as cursor:
+                return sorted(tuple(row) for row in await cursor.fetchall())
+
+    async def release_leases(self, owner, partitions):
+        async with self.transaction("release_leases") as conn:
+            await conn.executemany(
+                "UPDATE checker_leases SET owner = NULL, expires_at = 0 WHERE owner = ? AND partition = ?",
+                [(owner, partition) for partition in partitions]
+            )
+
+    # --- Очередь исходящих сообщений ---
+    async def pending_notifications(self, buckets=None):
+        """Неотправленные сообщения; buckets — только тревоги по этим корзинам"""
+        bucket_filter = ""
+        if buckets is not None:
+            bucket_filter = f"AND hash_bucket IN ({', '.join(str(int(bucket)) for bucket in sorted(buckets))})"
+        async with self.reader("pending_notifications") as conn:
+            # Зависшие в sending: процесс умер посреди отправки
+            async with conn.execute(
+                f"SELECT {OUTBOX_COLUMNS} FROM outbox "
+                f"WHERE (state = 'pending' OR (state = 'sending' AND next_attempt_at <= ?)) {bucket_filter} ORDER BY id",
+                (time.time(),)
+            ) as cursor:
+                return [row_to_notification(row) for row in await cursor.fetchall()]
+
+    async def claim_notification(self, notification_id, now, timeout, lease_owner=None):
+        """Забрать сообщение на отправку. False — его уже отправляет или отправил другой.
+
+        С lease_owner — только если раздел тревоги арендован им на момент
+        записи, как в claim_alarms.
+        Сообщение числится отправляемым timeout секунд.
+        """
+        lease_filter, lease_params = "", ()
+        if lease_owner is not None:
+            lease_filter = """
+                AND EXISTS (
+                    SELECT 1 FROM checker_leases
+                    WHERE owner = ? AND expires_at > ? AND outbox.hash_bucket BETWEEN bucket_lo AND bucket_hi
+                )
+            """
+            lease_params = (lease_owner, now)
+
+        async with self.transaction("claim_notification") as conn:
+            cursor = await conn.execute(f"""
+                UPDATE outbox SET state = 'sending', next_attempt_at = ?
+                WHERE id = ? AND (state = 'pending' OR (state = 'sending' AND next_attempt_at <= ?)) {lease_filter}
+            """, (now + timeout, notification_id, now, *lease_params))
+            return cursor.rowcount == 1
+
+    async def retry_notification(self, notification_id, attempts, next_attempt_at):
+        async with self.transaction("retry_notification") as conn:
+            await conn.execute(
+                "UPDATE outbox SET state = 'pending', attempts = ?, next_attempt_at = ? WHERE id = ?",
+                (attempts, next_attempt_at, notification_id)
+            )
+
+    async def finish_notification(self, notification_id, state):
+        """Отметить сообщение как sent или failed"""
+        async with self.transaction("finish_notification") as conn:
+            await conn.execute(
+                "UPDATE outbox SET state = ?, finished_at = ? WHERE id = ?",
+                (state, time.time(), notification_id)
+            )
+
+    async def prune_outbox(self, retention=OUTBOX_RETENTION_SECONDS):
+        """Удалить давно завершённые сообщения"""
+        async with self.transaction("prune_outbox") as conn:
+            await conn.execute(
+                "DELETE FROM outbox WHERE state != 'pending' AND finished_at < ?",
+                (time.time() - retention,)
+            )
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from storage import Storage
+
+@pytest.fixture
+def run():
+    """Один цикл событий на тест: открытые фикстурами базы и сценарий теста работают в нём"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "db"
+
+@pytest.fixture
+def open_storage(db_path, run):
+    """Открыть ещё один Storage (по умолчанию на db_path); все закрываются после теста"""
+    opened = []
+
+    def factory(path=db_path):
+        storage = Storage(str(path), readers=1)
+        run(storage.open())
+        opened.append(storage)
+        return storage
+
+    yield factory
+    for storage in opened:
+        run(storage.close())
+
+@pytest.fixture
+def storage(open_storage):
+    return open_storage()
@@ -0,0 +1,101 @@
+import asyncio
+
+from telegram import Update
+
+from bot_updates import ChatOrderedUpdateProcessor
+
+def update(update_id, chat_id):
+    """Команда /checkin из личного чата chat_id"""
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Имя"},
+            "text": "/checkin",
+            "entities": [{"type": "bot_command", "offset": 0, "length": len("/checkin")}]
+        }
+    }, None)
+
+def test_updates_of_one_chat_keep_order_while_chats_run_concurrently():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(concurrency=4, max_queued=100)
+        log = []
+        running = 0
+        peak = 0
+
+        async def handle(update_id, chat_id, delay):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            log.append(("start", chat_id, update_id))
+            await asyncio.sleep(delay)
+            log.append(("end", chat_id, update_id))
+            running -= 1
+
+        # Первое обновление чата медленнее второго: второе не должно его обогнать
+        updates = [(1, 10, 0.05), (2, 10, 0.0), (3, 20, 0.0), (4, 30, 0.0), (5, 20, 0.0)]
+        await asyncio.gather(*(
+            processor.process_update(update(update_id, chat_id), handle(update_id, chat_id, delay))
+            for update_id, chat_id, delay in updates
+        ))
+        return log, peak
+
+    log, peak = asyncio.run(scenario())
+    for chat_id in (10, 20, 30):
+        events = [(kind, update_id) for kind, chat, update_id in log if chat == chat_id]
+        started = [update_id for kind, update_id in events if kind == "start"]
+        assert started == sorted(started)
+        # Следующее обновление чата начинается только после конца предыдущего
+        for (kind, _), (next_kind, _) in zip(events, events[1:]):
+            assert kind != next_kind
+    # Чат 20 не ждал медленного чата 10
+    assert log.index(("end", 20, 3)) < log.index(("end", 10, 1))
+    assert peak > 1
+
+def test_concurrency_limit():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(concurrency=2, max_queued=100)
+        running = 0
+        peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(
+            processor.process_update(update(number, number), handle()) for number in range(10)
+        ))
+        return peak
+
+    assert asyncio.run(scenario()) == 2
+
+def test_updates_over_queue_limit_are_shed():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(concurrency=1, max_queued=2)
+        handled = []
+        rejected = []
+
+        async def reject(update):
+            rejected.append(update.update_id)
+
+        processor.reject = reject
+
+        async def handle(update_id):
+            handled.append(update_id)
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(
+            processor.process_update(update(number, number), handle(number)) for number in range(5)
+        ))
+        return handled, rejected, processor.queued
+
+    handled, rejected, queued = asyncio.run(scenario())
+    # Одно в обработке, два ждут — остальные отброшены
+    assert handled == [0, 1, 2]
+    assert rejected == [3, 4]
+    assert queued == 0
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from storage import CheckinBatcher
+
+class FakeStorage:
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+
+    async def write_checkins(self, checkins):
+        self.batches.append(dict(checkins))
+        if self.error is not None:
+            raise self.error
+
+def test_concurrent_checkins_are_written_in_one_batch():
+    async def scenario():
+        storage = FakeStorage()
+        batcher = CheckinBatcher(storage, flush_interval=0.05, max_batch=100)
+        batcher.start()
+        try:
+            await asyncio.gather(
+                batcher.update_checkin_time("a", "2026-01-01T00:00:00"),
+                batcher.update_checkin_time("b", "2026-01-01T00:00:01"),
+                # Повторная отметка склеивается с первой, побеждает последняя
+                batcher.update_checkin_time("a", "2026-01-01T00:00:02")
+            )
+        finally:
+            await batcher.stop()
+        return storage.batches
+
+    assert asyncio.run(scenario()) == [{"a": "2026-01-01T00:00:02", "b": "2026-01-01T00:00:01"}]
+
+def test_full_batch_is_written_without_waiting_for_interval():
+    async def scenario():
+        storage = FakeStorage()
+        batcher = CheckinBatcher(storage, flush_interval=10, max_batch=2)
+        batcher.start()
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                batcher.update_checkin_time("a", "t1"),
+                batcher.update_checkin_time("b", "t2")
+            ), timeout=1)
+        finally:
+            await batcher.stop()
+        return storage.batches
+
+    assert asyncio.run(scenario()) == [{"a": "t1", "b": "t2"}]
+
+def test_write_error_reaches_every_waiter():
+    async def scenario():
+        batcher = CheckinBatcher(FakeStorage(RuntimeError("database is locked")), flush_interval=0.01)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.update_checkin_time("a", "t1"),
+                batcher.update_checkin_time("b", "t2"),
+                return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(scenario())
+    assert len(results) == 2
+    for result in results:
+        assert isinstance(result, RuntimeError)
+
+def test_stop_flushes_pending_checkins():
+    async def scenario():
+        storage = FakeStorage()
+        batcher = CheckinBatcher(storage, flush_interval=10)
+        batcher.start()
+        waiter = asyncio.create_task(batcher.update_checkin_time("a", "t1"))
+        await asyncio.sleep(0)
+        await batcher.stop()
+        await waiter
+        return storage.batches
+
+    assert asyncio.run(scenario()) == [{"a": "t1"}]
+
+@pytest.mark.parametrize("max_batch", [1, 3])
+def test_every_checkin_is_acknowledged(max_batch):
+    async def scenario():
+        storage = FakeStorage()
+        batcher = CheckinBatcher(storage, flush_interval=0.01, max_batch=max_batch)
+        batcher.start()
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                *(batcher.update_checkin_time(str(number), "t") for number in range(10))
+            ), timeout=2)
+        finally:
+            await batcher.stop()
+        return storage.batches
+
+    batches = asyncio.run(scenario())
+    assert sorted(telegram_id for batch in batches for telegram_id in batch) == sorted(str(n) for n in range(10))
+
+def test_stop_waits_for_the_batch_being_written():
+    async def scenario():
+        storage = FakeStorage()
+        writing = asyncio.Event()
+        write_checkins = storage.write_checkins
+
+        async def slow_write(checkins):
+            writing.set()
+            await asyncio.sleep(0.05)
+            await write_checkins(checkins)
+
+        storage.write_checkins = slow_write
+        batcher = CheckinBatcher(storage, flush_interval=0)
+        batcher.start()
+        waiter = asyncio.create_task(batcher.update_checkin_time("a", "t1"))
+        await writing.wait()
+        await batcher.stop()
+        await asyncio.wait_for(waiter, timeout=1)
+        return storage.batches
+
+    assert asyncio.run(scenario()) == [{"a": "t1"}]
+
+def test_cancelled_write_fails_its_waiters():
+    async def scenario():
+        writing = asyncio.Event()
+
+        class HangingStorage:
+            async def write_checkins(self, checkins):
+                writing.set()
+                await asyncio.Event().wait()
+
+        batcher = CheckinBatcher(HangingStorage(), flush_interval=0)
+        batcher.start()
+        waiter = asyncio.create_task(batcher.update_checkin_time("a", "t1"))
+        await writing.wait()
+        batcher.task.cancel()
+        await asyncio.gather(batcher.task, return_exceptions=True)
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(scenario())
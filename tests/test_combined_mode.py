@@ -0,0 +1,34 @@
+import asyncio
+import sys
+import types
+
+import main
+
+def test_checker_is_restarted_after_a_startup_failure(monkeypatch):
+    monkeypatch.setattr(main, "CHECKER_RESTART_MIN_SECONDS", 0.01)
+    starts = []
+
+    class FlakyChecker:
+        def __init__(self, storage, bot):
+            pass
+
+        async def run_checker(self, metrics_port):
+            starts.append(metrics_port)
+            if len(starts) < 3:
+                raise ValueError("число разделов не совпадает")
+            await asyncio.Event().wait()
+
+    # Настоящий модуль проверки требует TELEGRAM_BOT_TOKEN при импорте
+    monkeypatch.setitem(sys.modules, "backend.checker", types.SimpleNamespace(StatusChecker=FlakyChecker))
+
+    async def scenario():
+        await main.start_checker(bot=None)
+        for _ in range(100):
+            if len(starts) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert not main.checker_task.done()
+        await main.stop_checker()
+
+    asyncio.run(scenario())
+    assert len(starts) == 3
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from events import StatusBroker
+
+class FakeStorage:
+    """Чтения отвечают в порядке, заданном тестом, а не в порядке вызова"""
+
+    def __init__(self):
+        self.reads = asyncio.Queue()
+
+    async def get_users_by_telegram_ids(self, telegram_ids):
+        answer = asyncio.get_running_loop().create_future()
+        await self.reads.put(answer)
+        return await answer
+
+def user(checkin_time):
+    return {
+        "telegram_id": "1",
+        "name": "Имя",
+        "contact_telegram_id": "2",
+        "checkin_time": checkin_time.isoformat(),
+        "deadline": (checkin_time + timedelta(hours=24)).timestamp(),
+        "alarm_sent_at": None
+    }
+
+def test_stale_refresh_finishing_last_is_dropped():
+    async def scenario():
+        storage = FakeStorage()
+        broker = StatusBroker(storage)
+        queue = asyncio.Queue()
+        broker.subscribers["1"] = {queue}
+
+        # Чтение по дедлайну началось до отметки, а закончилось после её обновления
+        stale = asyncio.create_task(broker.on_due([("1", time.time())]))
+        stale_read = await storage.reads.get()
+        broker.publish(["1"])
+        fresh_read = await storage.reads.get()
+
+        fresh_read.set_result([user(datetime.now())])
+        await asyncio.gather(*broker.pending)
+        stale_read.set_result([user(datetime.now() - timedelta(hours=25))])
+        await stale
+        return broker, queue
+
+    broker, queue = asyncio.run(scenario())
+    assert broker.last["1"]["status"] == "OK"
+    assert [queue.get_nowait()["status"] for _ in range(queue.qsize())] == ["OK"]
+    # Дедлайн новой отметки остался в расписании
+    assert "1" in broker.scheduler.deadlines
@@ -0,0 +1,153 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from leases import PartitionLeases
+from storage import hash_bucket
+
+PARTITIONS = 8
+
+async def nothing():
+    pass
+
+def owned_partitions(leases):
+    return {partition for partition, _, _ in leases.owned}
+
+@pytest.fixture
+def workers(open_storage, run):
+    """Два проверяющих процесса со своими соединениями к одной базе"""
+    def factory(ttl=30):
+        a = PartitionLeases(open_storage(), PARTITIONS, ttl=ttl, worker_id="a")
+        b = PartitionLeases(open_storage(), PARTITIONS, ttl=ttl, worker_id="b")
+        run(a.start())
+        run(b.start())
+        return a, b
+    return factory
+
+def test_two_workers_split_partitions_without_overlap(workers, run):
+    a, b = workers()
+
+    run(a.tick(nothing))
+    assert owned_partitions(a) == set(range(PARTITIONS))
+
+    # b появился: a отдаёт лишние разделы, b их забирает
+    run(b.tick(nothing))
+    assert not owned_partitions(a) & owned_partitions(b)
+    run(a.tick(nothing))
+    run(b.tick(nothing))
+
+    assert len(owned_partitions(a)) == len(owned_partitions(b)) == PARTITIONS // 2
+    assert not owned_partitions(a) & owned_partitions(b)
+    assert owned_partitions(a) | owned_partitions(b) == set(range(PARTITIONS))
+
+def test_partitions_of_silent_worker_are_taken_over_after_ttl(workers, run):
+    a, b = workers(ttl=0.5)
+    run(a.tick(nothing))
+    run(b.tick(nothing))
+    assert owned_partitions(b) == set()
+
+    # a перестал продлевать аренду
+    run(asyncio.sleep(0.6))
+    run(b.tick(nothing))
+    assert owned_partitions(b) == set(range(PARTITIONS))
+
+def test_release_waits_for_before_release(workers, run):
+    a, b = workers()
+    run(a.tick(nothing))
+    run(b.tick(nothing))
+
+    calls = []
+
+    async def before_release():
+        calls.append(len(a.owned))
+
+    run(a.tick(before_release))
+    assert calls == [PARTITIONS]
+
+def test_claim_alarms_skips_partitions_owned_by_others(workers, run):
+    a, b = workers()
+    first, second = a.storage, b.storage
+    for leases in (a, b, a, b):
+        run(leases.tick(nothing))
+
+    # Пользователь из раздела, который арендует a
+    telegram_id = next(str(number) for number in range(1000) if hash_bucket(str(number)) in a.buckets())
+    run(first.register_user(telegram_id, "Имя", "contact"))
+    run(first.writer.execute("UPDATE users SET deadline = ? WHERE telegram_id = ?", (time.time() - 1, telegram_id)))
+    run(first.writer.commit())
+
+    def build(user):
+        return user["contact_telegram_id"], "тревога", 0, f"alarm:{user['telegram_id']}"
+
+    claimed, _ = run(second.claim_alarms([telegram_id], time.time(), build, lease_owner="b"))
+    assert claimed == 0
+    claimed, notifications = run(first.claim_alarms([telegram_id], time.time(), build, lease_owner="a"))
+    assert claimed == 1
+    assert len(notifications) == 1
+
+    # Отправить сообщение может только владелец раздела тревоги
+    notification_id = notifications[0]["id"]
+    assert not run(second.claim_notification(notification_id, time.time(), 60, "b"))
+    assert run(first.claim_notification(notification_id, time.time(), 60, "a"))
+    assert not run(first.claim_notification(notification_id, time.time(), 60, "a"))
+
+def test_outbox_rows_from_before_partitioning_belong_to_bucket_zero(db_path, open_storage, run):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 1,
+                dedupe_key TEXT UNIQUE,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("INSERT INTO outbox (chat_id, text, created_at, next_attempt_at) VALUES ('chat', 'текст', 0, 0)")
+    conn.close()
+
+    storage = open_storage()
+    leases = PartitionLeases(storage, PARTITIONS, ttl=30, worker_id="a")
+    run(leases.start())
+    run(leases.tick(nothing))
+    assert [item["id"] for item in run(storage.pending_notifications({0}))] == [1]
+
+    run(storage.release_leases("a", [0]))
+    assert not run(storage.claim_notification(1, time.time(), 60, "a"))
+    run(leases.tick(nothing))
+    assert run(storage.claim_notification(1, time.time(), 60, "a"))
+
+def test_deadline_pages_of_a_partition_cover_its_buckets(storage, run):
+    telegram_ids = [str(number) for number in range(200)]
+    run(storage.register_users([(telegram_id, "Имя", "contact") for telegram_id in telegram_ids]))
+
+    async def load():
+        return [
+            page async for page in storage.iter_users_by_deadline(
+                time.time() + 2 * 86400, page_size=7, buckets=set(range(64))
+            )
+        ]
+
+    async def plan():
+        async with storage.reader() as conn:
+            async with conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM users WHERE alarm_sent_at IS NULL AND deadline <= ? "
+                "AND (deadline, id) > (?, ?) AND hash_bucket = ? ORDER BY deadline, id LIMIT 10",
+                (0, 0, 0, 0)
+            ) as cursor:
+                return " ".join(row[3] for row in await cursor.fetchall())
+
+    pages = run(load())
+    loaded = [user["telegram_id"] for page in pages for user in page]
+    assert sorted(loaded) == sorted(telegram_id for telegram_id in telegram_ids if hash_bucket(telegram_id) < 64)
+    assert all(len(page) == 7 for page in pages[:-1])
+    # Порядок страницы берётся из индекса, без сортировки остатка окна
+    query_plan = run(plan())
+    assert "ix_users_pending_bucket" in query_plan
+    assert "TEMP B-TREE" not in query_plan
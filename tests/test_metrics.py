@@ -0,0 +1,19 @@
+from metrics import Counter, Gauge, Histogram, Registry
+
+def test_each_metric_kind_renders_its_children():
+    registry = Registry()
+    requests = Counter("requests_total", "Запросы", ("route",), registry=registry)
+    backlog = Gauge("backlog", "Очередь", registry=registry)
+    latency = Histogram("latency_seconds", "Время", buckets=(0.1, 1.0), registry=registry)
+
+    requests.labels("/status").inc(2)
+    backlog.set_function(lambda: 7)
+    latency.observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/status"} 2' in lines
+    assert "backlog 7" in lines
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in lines
+    assert "latency_seconds_count 1" in lines
@@ -0,0 +1,199 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+import notifier
+from notifier import SENDING_TIMEOUT_SECONDS, NotificationDispatcher, TokenBucket
+
+class FakeBot:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+class FakeStorage:
+    """outbox в памяти; fail[метод] — сколько следующих вызовов метода упадёт"""
+
+    def __init__(self, *items):
+        self.rows = {item["id"]: {**item, "state": "pending"} for item in items}
+        self.fail = {}
+        self.retries = []
+
+    def check(self, method):
+        if self.fail.get(method):
+            self.fail[method] -= 1
+            raise RuntimeError("database is locked")
+
+    async def claim_notification(self, notification_id, now, timeout, lease_owner=None):
+        self.check("claim_notification")
+        row = self.rows[notification_id]
+        if row["state"] == "pending" or (row["state"] == "sending" and row["next_attempt_at"] <= now):
+            row["state"], row["next_attempt_at"] = "sending", now + timeout
+            return True
+        return False
+
+    async def retry_notification(self, notification_id, attempts, next_attempt_at):
+        self.check("retry_notification")
+        self.retries.append((notification_id, attempts, next_attempt_at))
+        self.rows[notification_id].update(state="pending", attempts=attempts, next_attempt_at=next_attempt_at)
+
+    async def finish_notification(self, notification_id, state):
+        self.check("finish_notification")
+        self.rows[notification_id]["state"] = state
+
+    async def prune_outbox(self):
+        pass
+
+    async def pending_notifications(self, buckets=None):
+        self.check("pending_notifications")
+        now = time.time()
+        return [
+            {key: row[key] for key in ("id", "chat_id", "text", "priority", "attempts", "next_attempt_at")}
+            for row in self.rows.values()
+            if row["state"] == "pending" or (row["state"] == "sending" and row["next_attempt_at"] <= now)
+        ]
+
+def notification(notification_id=1, chat_id="chat"):
+    return {
+        "id": notification_id,
+        "chat_id": chat_id,
+        "text": "тревога",
+        "priority": 0,
+        "attempts": 0,
+        "next_attempt_at": 0
+    }
+
+async def deliver(dispatcher, item):
+    # Как run(): место в in_flight занимается до отправки
+    await dispatcher.in_flight.acquire()
+    await dispatcher.send(item)
+
+@pytest.fixture(autouse=True)
+def fast_outbox_retries(monkeypatch):
+    monkeypatch.setattr(notifier, "OUTBOX_WRITE_RETRY_SECONDS", 0.01)
+
+def test_token_bucket_limits_rate_and_blocks_after_429():
+    bucket = TokenBucket(rate=2, capacity=1)
+    now = bucket.updated
+    assert bucket.wait_time(now) == 0
+    bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.5) == 0
+
+    bucket.block(now + 0.5, 3)
+    assert bucket.wait_time(now + 1) == pytest.approx(2.5)
+
+def test_sent_message_is_finished_once():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot()
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        return storage, bot, dispatcher
+
+    storage, bot, dispatcher = asyncio.run(scenario())
+    assert bot.sent == [("chat", "тревога")]
+    assert storage.rows[1]["state"] == "sent"
+    assert not dispatcher.queued
+
+def test_retry_after_pauses_every_chat():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot(RetryAfter(5))
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        return storage, bot, dispatcher
+
+    storage, bot, dispatcher = asyncio.run(scenario())
+    assert bot.sent == []
+    assert dispatcher.global_bucket.wait_time(time.monotonic()) > 4
+    assert dispatcher.chat_bucket("other").wait_time(time.monotonic()) == 0
+    [(_, attempts, next_attempt_at)] = storage.retries
+    assert attempts == 1
+    assert next_attempt_at - time.time() == pytest.approx(5, abs=1)
+    # Сообщение вернулось в очередь до следующей попытки
+    assert [item["id"] for _, _, item in dispatcher.delayed] == [1]
+    assert storage.rows[1]["state"] == "pending"
+
+def test_undeliverable_message_is_failed_without_retry():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot(Forbidden("bot was blocked by the user"))
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        return storage, dispatcher
+
+    storage, dispatcher = asyncio.run(scenario())
+    assert storage.rows[1]["state"] == "failed"
+    assert not dispatcher.delayed and not dispatcher.ready
+
+def test_failed_claim_requeues_message():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot()
+        storage.fail["claim_notification"] = 1
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        requeued = [item for _, _, item in dispatcher.delayed]
+        assert [item["id"] for item in requeued] == [1]
+        await deliver(dispatcher, requeued[0])
+        return storage, bot
+
+    storage, bot = asyncio.run(scenario())
+    assert bot.sent == [("chat", "тревога")]
+    assert storage.rows[1]["state"] == "sent"
+
+def test_failed_finish_is_retried_instead_of_resending():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot()
+        storage.fail["finish_notification"] = 2
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        return storage, bot, dispatcher
+
+    storage, bot, dispatcher = asyncio.run(scenario())
+    assert bot.sent == [("chat", "тревога")]
+    assert storage.rows[1]["state"] == "sent"
+    assert not dispatcher.delayed and not dispatcher.ready
+
+def test_failed_retry_write_keeps_message_until_claim_expires():
+    async def scenario():
+        storage, bot = FakeStorage(notification()), FakeBot(RuntimeError("network"))
+        storage.fail["retry_notification"] = 1
+        dispatcher = NotificationDispatcher(storage, bot)
+        await deliver(dispatcher, notification())
+        return storage, dispatcher
+
+    storage, dispatcher = asyncio.run(scenario())
+    [(next_attempt_at, _, item)] = dispatcher.delayed
+    assert item["attempts"] == 1
+    # Строка ещё в sending: раньше её всё равно не забрать
+    assert next_attempt_at - time.time() == pytest.approx(SENDING_TIMEOUT_SECONDS, abs=1)
+    assert storage.rows[1]["state"] == "sending"
+
+def test_reload_picks_up_rows_missing_from_memory(monkeypatch):
+    monkeypatch.setattr(notifier, "OUTBOX_RELOAD_SECONDS", 0.05)
+
+    async def scenario():
+        storage, bot = FakeStorage(), FakeBot()
+        dispatcher = NotificationDispatcher(storage, bot, owns_bot=False)
+        await dispatcher.start()
+        try:
+            # Строка появилась в outbox, а в память не попала (например, упал push после сбоя)
+            storage.rows[1] = {**notification(), "state": "pending"}
+            storage.rows[2] = {**notification(2), "state": "sending", "next_attempt_at": time.time() + 60}
+            for _ in range(50):
+                if bot.sent:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await dispatcher.stop()
+        return storage, bot
+
+    storage, bot = asyncio.run(scenario())
+    assert bot.sent == [("chat", "тревога")]
+    assert storage.rows[1]["state"] == "sent"
+    # Чужая отправка, claim которой ещё не истёк, не трогается
+    assert storage.rows[2]["state"] == "sending"
@@ -0,0 +1,125 @@
+import asyncio
+import math
+
+import pytest
+
+from scheduler import DeadlineScheduler
+
+class FakeWindows:
+    """load_window по словарю дедлайнов; fail — сколько следующих окон упадёт посередине"""
+
+    def __init__(self, deadlines):
+        self.deadlines = deadlines
+        self.calls = []
+        self.fail = 0
+
+    async def __call__(self, after, until):
+        self.calls.append((after, until))
+        for telegram_id, deadline in sorted(self.deadlines.items(), key=lambda item: item[1]):
+            if (after is None or deadline > after) and deadline <= until:
+                yield telegram_id, deadline
+                if self.fail:
+                    self.fail -= 1
+                    raise RuntimeError("database is locked")
+
+def test_window_loads_only_near_deadlines():
+    windows = FakeWindows({"a": 50, "b": 150, "c": 250})
+    scheduler = DeadlineScheduler(windows, horizon=100)
+
+    asyncio.run(scheduler.load_next_window(100))
+    assert windows.calls == [(None, 200)]
+    assert scheduler.deadlines == {"a": 50, "b": 150}
+
+    asyncio.run(scheduler.load_next_window(190))
+    assert windows.calls[-1] == (200, 290)
+    assert scheduler.deadlines == {"a": 50, "b": 150, "c": 250}
+
+def test_schedule_past_the_loaded_window_is_left_to_the_next_window():
+    scheduler = DeadlineScheduler(FakeWindows({}), horizon=100)
+    asyncio.run(scheduler.load_next_window(0))
+
+    scheduler.schedule("a", 50)
+    assert scheduler.deadlines == {"a": 50}
+    # Новая отметка дальше окна: старый дедлайн снимается, новый подгрузится из базы
+    scheduler.schedule("a", 500)
+    assert scheduler.deadlines == {}
+    assert scheduler.pop_due(1000) == []
+
+def test_pop_due_skips_stale_heap_entries():
+    scheduler = DeadlineScheduler(None)
+    asyncio.run(scheduler.load_next_window(0))
+
+    scheduler.schedule("a", 10)
+    scheduler.schedule("a", 30)  # Перенос: запись (10, "a") в куче устарела
+    scheduler.schedule("b", 20)
+    scheduler.schedule("c", 15)
+    scheduler.cancel("c")
+
+    assert scheduler.pop_due(25) == [("b", 20)]
+    assert scheduler.pop_due(35) == [("a", 30)]
+    assert scheduler.heap == []
+    assert len(scheduler) == 0
+
+def test_failed_window_is_read_again():
+    windows = FakeWindows({"a": 10, "b": 20, "c": 30})
+    windows.fail = 1
+    scheduler = DeadlineScheduler(windows, horizon=100)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.load_next_window(0))
+    # Граница откатилась: окно не считается прочитанным
+    assert scheduler.loaded_until is None
+
+    asyncio.run(scheduler.load_next_window(0))
+    assert windows.calls == [(None, 100), (None, 100)]
+    assert scheduler.deadlines == {"a": 10, "b": 20, "c": 30}
+
+def test_run_retries_after_a_failed_window():
+    windows = FakeWindows({"a": 0})
+    windows.fail = 1
+    scheduler = DeadlineScheduler(windows, horizon=100)
+    due = []
+
+    async def on_due(items):
+        due.extend(items)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await scheduler.run(on_due)
+        # Цикл проверяющего перезапускает run(): окно читается с той же границы
+        task = asyncio.create_task(scheduler.run(on_due))
+        for _ in range(100):
+            if due:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert due == [("a", 0)]
+    assert [after for after, _ in windows.calls] == [None, None]
+
+def test_without_load_window_only_scheduled_deadlines_fire():
+    scheduler = DeadlineScheduler(None, horizon=100)
+    due = []
+
+    async def on_due(items):
+        due.extend(items)
+
+    async def scenario():
+        task = asyncio.create_task(scheduler.run(on_due))
+        await asyncio.sleep(0)
+        assert scheduler.loaded_until == math.inf
+        # Окна нет: далёкий дедлайн не отбрасывается, а ближний будит цикл
+        scheduler.schedule("far", 10 ** 12)
+        scheduler.schedule("near", 0)
+        for _ in range(100):
+            if due:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert due == [("near", 0)]
+    assert scheduler.deadlines == {"far": 10 ** 12}
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+from status_cache import StatusCache, build_status_entry, is_not_modified
+
+NOW = datetime(2026, 1, 2, 12).timestamp()
+
+def user(checkin_time="2026-01-02T00:00:00", contact="2"):
+    return {
+        "telegram_id": "1",
+        "checkin_time": checkin_time,
+        "deadline": (datetime.fromisoformat(checkin_time) + timedelta(hours=24)).timestamp(),
+        "contact_telegram_id": contact
+    }
+
+def test_status_flips_to_alarm_at_the_deadline():
+    entry = build_status_entry(user(), NOW)
+    assert entry["body"]["status"] == "OK"
+    assert entry["flips_at"] == datetime(2026, 1, 3).timestamp()
+
+    alarm = build_status_entry(user(), entry["flips_at"] + 1)
+    assert alarm["body"]["status"] == "ALARM"
+    assert alarm["flips_at"] is None
+    assert alarm["headers"]["ETag"] != entry["headers"]["ETag"]
+
+def test_not_modified_follows_the_etag():
+    entry = build_status_entry(user(), NOW)
+    etag = entry["headers"]["ETag"]
+    assert is_not_modified({"if-none-match": etag}, entry)
+    assert is_not_modified({"if-none-match": f'"other", {etag}'}, entry)
+    assert is_not_modified({"if-none-match": "*"}, entry)
+    assert not is_not_modified({"if-none-match": '"other"'}, entry)
+    assert not is_not_modified({}, entry)
+
+def test_contact_change_without_checkin_is_modified():
+    entry = build_status_entry(user(), NOW)
+    changed = build_status_entry(user(contact="3"), NOW)
+    # Дата отметки та же, но ответ другой: If-Modified-Since дал бы 304 со старым контактом
+    assert not is_not_modified({"if-none-match": entry["headers"]["ETag"]}, changed)
+    assert not is_not_modified({"if-modified-since": "Fri, 02 Jan 2099 00:00:00 GMT"}, changed)
+    assert "Last-Modified" not in changed["headers"]
+
+def test_entry_expires_after_ttl_or_at_the_deadline():
+    cache = StatusCache(ttl=60)
+    entry = build_status_entry(user(), NOW)
+    cache.put("1", entry, NOW, cache.read_token())
+    assert cache.get("1", NOW + 59) is entry
+    assert cache.get("1", NOW + 60) is None
+
+    # До дедлайна меньше TTL: запись живёт только до него
+    close = build_status_entry(user(), entry["flips_at"] - 10)
+    cache.put("1", close, entry["flips_at"] - 10, cache.read_token())
+    assert cache.get("1", entry["flips_at"] - 1) is close
+    assert cache.get("1", entry["flips_at"]) is None
+
+def test_read_started_before_invalidation_is_not_cached():
+    cache = StatusCache()
+    token = cache.read_token()
+    cache.invalidate("1")
+    cache.put("1", build_status_entry(user(), NOW), NOW, token)
+    assert cache.get("1", NOW) is None
+
+    token = cache.read_token()
+    cache.clear()
+    cache.put("1", build_status_entry(user(), NOW), NOW, token)
+    assert cache.get("1", NOW) is None
+
+    # Сброс другого пользователя не мешает
+    token = cache.read_token()
+    cache.invalidate("2")
+    cache.put("1", build_status_entry(user(), NOW), NOW, token)
+    assert cache.get("1", NOW) is not None
+
+def test_cache_is_bounded_and_counts_hits():
+    cache = StatusCache(max_size=2)
+    for telegram_id in ("1", "2", "3"):
+        cache.put(telegram_id, build_status_entry(user(), NOW), NOW, cache.read_token())
+    assert len(cache) == 2
+    assert cache.get("1", NOW) is None
+    assert cache.get("3", NOW) is not None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,75 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from transfer import import_stream
+
+async def chunks(*lines):
+    yield "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+async def import_lines(storage, *lines, update_existing=False):
+    stats = await import_stream(storage, chunks(*lines), "ndjson", update_existing)
+    users = {telegram_id: await storage.get_user_by_telegram_id(telegram_id) for telegram_id in ("1", "2")}
+    return stats, users
+
+@pytest.mark.parametrize("record", [
+    {"telegram_id": "1", "name": "a", "alarm_sent_at": [1]},
+    {"telegram_id": "1", "name": "a", "alarm_sent_at": {"at": 1}},
+    {"telegram_id": "1", "name": "a", "alarm_sent_at": "nan"},
+    {"telegram_id": "1", "name": "a", "alarm_sent_at": "inf"},
+    {"telegram_id": "1", "name": "a", "checkin_time": 1700000000},
+    {"telegram_id": "1", "name": "a", "checkin_time": "9999-12-31T23:00:00"},
+    {"telegram_id": ["1"], "name": "a"},
+    {"telegram_id": "1", "name": {"first": "a"}},
+])
+def test_invalid_fields_are_counted_as_errors(storage, run, record):
+    valid = {"telegram_id": "2", "name": "b"}
+    stats, users = run(import_lines(storage, record, valid))
+
+    assert stats["errors"] == 1
+    assert stats["error_samples"][0]["line"] == 1
+    assert stats["written"] == 1
+    assert users["1"] is None
+    assert users["2"] is not None
+
+def test_update_takes_checkin_and_alarm_from_the_later_deadline(db_path, open_storage, run):
+    # Старая база: отметка в формате CURRENT_TIMESTAMP, дедлайн появится при миграции
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                contact_telegram_id TEXT,
+                checkin_time TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("INSERT INTO users (telegram_id, name, checkin_time) VALUES ('1', 'a', '2026-01-01 12:00:00')")
+    conn.close()
+
+    # Отметка из файла раньше, хотя строкой «2026-01-01T09» больше «2026-01-01 12»
+    stats, users = run(import_lines(
+        open_storage(),
+        {"telegram_id": "1", "name": "b", "checkin_time": "2026-01-01T09:00:00", "alarm_sent_at": 1.0},
+        update_existing=True
+    ))
+
+    assert stats["written"] == 1
+    user = users["1"]
+    assert user["name"] == "b"
+    assert user["checkin_time"] == "2026-01-01 12:00:00"
+    assert user["alarm_sent_at"] is None
+
+def test_update_with_later_checkin_takes_its_alarm_ledger(storage, run):
+    run(import_lines(storage, {"telegram_id": "1", "name": "a", "checkin_time": "2026-01-01T09:00:00"}))
+    _, users = run(import_lines(
+        storage,
+        {"telegram_id": "1", "name": "a", "checkin_time": "2026-01-01T12:00:00", "alarm_sent_at": 1.0},
+        update_existing=True
+    ))
+
+    assert users["1"]["checkin_time"] == "2026-01-01T12:00:00"
+    assert users["1"]["deadline"] == pytest.approx(datetime(2026, 1, 2, 12).timestamp())
+    assert users["1"]["alarm_sent_at"] == 1.0
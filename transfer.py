@@ -0,0 +1,297 @@
+"""Массовая загрузка и выгрузка пользователей в NDJSON и CSV.
+
+Используется эндпоинтами /admin/import и /admin/export и напрямую из консоли:
+
+    python transfer.py export users.ndjson
+    python transfer.py export --format csv - > users.csv
+    python transfer.py import users.csv --update
+
+Файл читается и пишется потоком, пачками по IMPORT_CHUNK_SIZE строк,
+поэтому память не зависит от размера файла.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+from storage import DB_PATH, Storage, compute_deadline
+
+# --- Конфигурация ---
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "50000"))  # Строк в одной транзакции
+IMPORT_ERROR_SAMPLES = 20  # Сколько ошибок разбора вернуть с номерами строк
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+EXPORT_FIELDS = ("telegram_id", "name", "contact_telegram_id", "checkin_time", "deadline", "alarm_sent_at")
+
+def detect_format(path, default="ndjson"):
+    extension = os.path.splitext(path or "")[1].lstrip(".").lower()
+    if extension in ("jsonl", "json"):
+        return "ndjson"
+    return extension if extension in FORMATS else default
+
+# --- Разбор ---
+INVALID_ENCODING = "строка не в кодировке UTF-8"
+
+def decode_lines(data, encoding):
+    """Строки куска; строка не в UTF-8 становится None и считается ошибкой разбора"""
+    try:
+        return data.decode(encoding).split("\n")
+    except UnicodeDecodeError:
+        lines = []
+        for raw in data.split(b"\n"):
+            try:
+                lines.append(raw.decode(encoding))
+            except UnicodeDecodeError:
+                lines.append(None)
+            encoding = "utf-8"
+        return lines
+
+async def iter_line_batches(chunks):
+    """Строки из потока байтов (тело запроса, файл) списками, по одному на кусок.
+
+    Кусок декодируется и делится целиком: разбор идёт без await на каждую строку.
+    """
+    tail = b""
+    encoding = "utf-8-sig"  # BOM возможен только в начале файла
+    async for chunk in chunks:
+        buffer = tail + chunk
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            tail = buffer
+            continue
+        tail = buffer[end + 1:]
+        yield decode_lines(buffer[:end], encoding)
+        encoding = "utf-8"
+    if tail:
+        yield decode_lines(tail, encoding)
+
+class NdjsonRecords:
+    def __init__(self):
+        self.line_number = 0
+
+    def feed(self, lines):
+        """[(номер строки, запись или ValueError)]"""
+        first = self.line_number + 1
+        self.line_number += len(lines)
+        numbered = [
+            (number, line) for number, line in enumerate(lines, first)
+            if line is None or (line and not line.isspace())
+        ]
+        try:
+            # Весь кусок одним вызовом json: в разы быстрее, чем построчно
+            records = json.loads("[" + ",".join(line for _, line in numbered) + "]")
+        except (json.JSONDecodeError, TypeError):
+            return [self.decode(number, line) for number, line in numbered]
+        if len(records) != len(numbered):
+            # Строка вида «1, 2» склеилась бы в несколько значений
+            return [self.decode(number, line) for number, line in numbered]
+        return list(zip((number for number, _ in numbered), records))
+
+    @staticmethod
+    def decode(number, line):
+        if line is None:
+            return number, ValueError(INVALID_ENCODING)
+        try:
+            return number, json.loads(line)
+        except json.JSONDecodeError as e:
+            return number, ValueError(f"неверный JSON: {e.msg}")
+
+class CsvRecords:
+    """Записи CSV с заголовком; поле в кавычках может занимать несколько строк"""
+
+    def __init__(self):
+        self.line_number = 0
+        self.header = None
+        self.pending = ""
+
+    def feed(self, lines):
+        records = []
+        for line in lines:
+            self.line_number += 1
+            if line is None:
+                # Незакрытая запись с этой строкой всё равно испорчена
+                self.pending = ""
+                records.append((self.line_number, ValueError(INVALID_ENCODING)))
+                continue
+            line = line.rstrip("\r")
+            record = f"{self.pending}\n{line}" if self.pending else line
+            if record.count('"') % 2:
+                self.pending = record
+                continue
+            self.pending = ""
+            if not record.strip():
+                continue
+
+            values = next(csv.reader([record]))
+            if self.header is None:
+                self.header = [name.strip() for name in values]
+                continue
+            records.append((self.line_number, dict(zip(self.header, values))))
+        return records
+
+def text_field(record, key):
+    """Строковое поле записи; число допускается (telegram_id в JSON бывает числом)"""
+    value = record.get(key)
+    if value is None:
+        return ""
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"{key}: ожидалась строка")
+    return str(value).strip()
+
+def parse_record(record, now):
+    """Запись файла -> (telegram_id, name, contact_telegram_id, checkin_time, alarm_sent_at) или ValueError"""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("ожидался объект")
+
+    telegram_id = text_field(record, "telegram_id")
+    name = text_field(record, "name")
+    if not telegram_id or not name:
+        raise ValueError("нужны telegram_id и name")
+    contact_telegram_id = text_field(record, "contact_telegram_id") or None
+
+    checkin_time = record.get("checkin_time")
+    if checkin_time in (None, ""):
+        checkin_time = now
+    elif not isinstance(checkin_time, str):
+        raise ValueError("checkin_time: ожидалась строка ISO 8601")
+    else:
+        try:
+            checkin_time = datetime.fromisoformat(checkin_time).isoformat()
+            compute_deadline(checkin_time)  # Дата у границы datetime не даст дедлайна
+        except (ValueError, OverflowError, OSError):
+            raise ValueError(f"checkin_time: неверная дата {checkin_time!r}") from None
+
+    # Журнал тревог: без него восстановление из выгрузки подняло бы тревоги повторно
+    alarm_sent_at = record.get("alarm_sent_at")
+    if alarm_sent_at in (None, ""):
+        alarm_sent_at = None
+    else:
+        if isinstance(alarm_sent_at, bool):
+            raise ValueError("alarm_sent_at: ожидалось число")
+        try:
+            alarm_sent_at = float(alarm_sent_at)
+        except (TypeError, ValueError):
+            raise ValueError("alarm_sent_at: ожидалось число") from None
+        if not math.isfinite(alarm_sent_at):
+            raise ValueError("alarm_sent_at: ожидалось конечное число")
+
+    return telegram_id, name, contact_telegram_id, checkin_time, alarm_sent_at
+
+async def import_stream(storage, chunks, fmt, update_existing=False, on_chunk=None):
+    """Загрузка из потока байтов. on_chunk(telegram_ids) вызывается после каждой записанной пачки"""
+    parser = CsvRecords() if fmt == "csv" else NdjsonRecords()
+    now = datetime.now().isoformat()
+    stats = {"read": 0, "written": 0, "skipped": 0, "errors": 0, "error_samples": []}
+    batch = []
+
+    async def flush():
+        written = await storage.import_users(batch, update_existing)
+        stats["written"] += written
+        stats["skipped"] += len(batch) - written
+        if on_chunk is not None:
+            on_chunk([user[0] for user in batch])
+        batch.clear()
+
+    async for lines in iter_line_batches(chunks):
+        for line_number, record in parser.feed(lines):
+            stats["read"] += 1
+            try:
+                batch.append(parse_record(record, now))
+            except ValueError as e:
+                stats["errors"] += 1
+                if len(stats["error_samples"]) < IMPORT_ERROR_SAMPLES:
+                    stats["error_samples"].append({"line": line_number, "error": str(e)})
+                continue
+            if len(batch) >= IMPORT_CHUNK_SIZE:
+                await flush()
+
+    if batch:
+        await flush()
+    return stats
+
+# --- Выгрузка ---
+def format_rows(rows, fmt):
+    """Пачка строк из export_users() в текст выбранного формата"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+    return "".join(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+async def export_stream(storage, fmt, stats=None):
+    """Выгрузка кусками текста: для StreamingResponse и для файла"""
+    if fmt == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\n"
+    async for rows in storage.export_users():
+        if stats is not None:
+            stats["exported"] += len(rows)
+        yield format_rows(rows, fmt)
+
+# --- Консоль ---
+async def read_file(f, size=1 << 20):
+    while True:
+        chunk = await asyncio.to_thread(f.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+async def run_import(storage, args):
+    fmt = args.format or detect_format(args.path)
+    f = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        return await import_stream(storage, read_file(f), fmt, args.update)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+async def run_export(storage, args):
+    fmt = args.format or detect_format(args.path)
+    f = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8", newline="")
+    stats = {"exported": 0}
+    try:
+        async for text in export_stream(storage, fmt, stats):
+            await asyncio.to_thread(f.write, text)
+    finally:
+        if f is sys.stdout:
+            f.flush()
+        else:
+            f.close()
+    return stats
+
+async def main(args):
+    storage = Storage(args.db)
+    await storage.open()
+    started = time.perf_counter()
+    try:
+        if args.command == "import":
+            stats = await run_import(storage, args)
+        else:
+            stats = await run_export(storage, args)
+    finally:
+        await storage.close()
+    stats["duration_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка и выгрузка пользователей")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Загрузить пользователей из файла")
+    import_parser.add_argument("path", help="Файл или - для stdin")
+    import_parser.add_argument("--format", choices=FORMATS, help="По умолчанию по расширению файла")
+    import_parser.add_argument("--update", action="store_true", help="Обновлять уже существующих")
+
+    export_parser = commands.add_parser("export", help="Выгрузить пользователей в файл")
+    export_parser.add_argument("path", help="Файл или - для stdout")
+    export_parser.add_argument("--format", choices=FORMATS, help="По умолчанию по расширению файла")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from bot_updates import chat_key
+from metrics import BOT_UPDATE_WAIT_SECONDS, BOT_UPDATES_IN_PROGRESS, BOT_UPDATES_QUEUED, BOT_UPDATES_SHED
+
+# --- Конфигурация ---
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))  # На каждого обработчика
+WEBHOOK_DEDUP_SIZE = 10000  # Сколько последних update_id помнить для отсева повторов
+WEBHOOK_DRAIN_SECONDS = 10  # Сколько ждать обработки очереди при остановке
+
+class UpdatePipeline:
+    """Конвейер входящих обновлений Telegram.
+
+    Каждый обработчик читает свою ограниченную очередь, обновления одного чата
+    всегда попадают в одну и ту же очередь, поэтому обрабатываются по порядку.
+    Переполненная очередь означает отказ: Telegram повторит доставку позже.
+    """
+
+    def __init__(self, application, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.tasks = []
+        self.seen_ids = set()
+        self.seen_order = deque()
+        self.running = 0
+
+    def remember(self, update_id):
+        self.seen_ids.add(update_id)
+        self.seen_order.append(update_id)
+        if len(self.seen_order) > WEBHOOK_DEDUP_SIZE:
+            self.seen_ids.discard(self.seen_order.popleft())
+
+    def submit(self, update):
+        """Поставить обновление в очередь. False — очередь переполнена"""
+        if update.update_id in self.seen_ids:
+            # Повторная доставка: уже в работе или обработано
+            return True
+
+        queue = self.queues[hash(chat_key(update)) % len(self.queues)]
+        try:
+            queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            BOT_UPDATES_SHED.labels("webhook").inc()
+            return False
+
+        self.remember(update.update_id)
+        return True
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def worker(self, queue):
+        while True:
+            queued_at, update = await queue.get()
+            BOT_UPDATE_WAIT_SECONDS.labels("webhook").observe(time.perf_counter() - queued_at)
+            self.running += 1
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                print(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self.running -= 1
+                queue.task_done()
+
+    def start(self):
+        BOT_UPDATES_QUEUED.labels("webhook").set_function(self.depth)
+        BOT_UPDATES_IN_PROGRESS.labels("webhook").set_function(lambda: self.running)
+        self.tasks = [asyncio.create_task(self.worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        """Дождаться обработки принятых обновлений и остановить обработчиков"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)),
+                timeout=WEBHOOK_DRAIN_SECONDS
+            )
+        except asyncio.TimeoutError:
+            print(f"⚠️ Остановка с необработанными обновлениями: {self.depth()}")
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []